@@ -1,27 +1,61 @@
+import altair as alt
 import pandas as pd
-from sqlalchemy import create_engine
 import streamlit as st
-import matplotlib.pyplot as plt
-from cycler import cycler
 import locale
 import os
 from dotenv import load_dotenv
+from sqlalchemy.exc import SQLAlchemyError
 from datetime import datetime
-from io import BytesIO
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from babel.numbers import format_currency
 import calendar
+from conexao import criar_engine
+from consultas import TABELA_RECEBIMENTOS, TAMANHO_LOTE_PADRAO, carregar_agregado, ordinal_mes
+from sincronizacao import INTERVALO_PADRAO, criar_sincronizacao, ler_marca_atualizacao, meses_alterados, sincronizar
+from compartilhado import DIRETORIO_PADRAO as COMPARTILHADO_PADRAO, criar_compartilhado, iniciar_atualizador, obter_compartilhado
+from fontes import TIMEOUT_PADRAO, coletar, criar_fontes, ler_fontes, situacao_fontes, tabelas_fontes
+from snapshot import DIRETORIO_PADRAO
+from graficos import LIMITE_BYTES_PADRAO, criar_cache_graficos, obter_grafico, renderizar_grafico_categoria, renderizar_grafico_produto
+from relatorio import criar_fila_relatorios, consultar_relatorio, solicitar_relatorio
+from cubo import N_PADRAO, anos_disponiveis, construir_cubo, extremos, painel_do_cubo, recebimento_por_categoria, recebimento_por_produto, total_periodo, variacao
+from indice import combinar_diarios, criar_detalhamento, dias_do_mes, obter_indice, produtos_da_categoria, serie_diaria
+from variacao import calcular_variacoes, formatar_variacao, variacao_percentual
+from instrumentacao import configurar_log, criar_metricas, exportar_prometheus, medir_etapa, novo_registro, percentis, registrar
 
 # Carregar variáveis do arquivo .env
 load_dotenv()
 
-# Credenciais do banco de dados do .env
-db_host = os.getenv("DB_HOST")
-db_port = os.getenv("DB_PORT")
-db_name = os.getenv("DB_NAME")
-db_user = os.getenv("DB_USER")
-db_password = os.getenv("DB_PASSWORD")
+# Credenciais do banco de dados do .env (DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD ou DB_URL),
+# driver (DB_DRIVER), pool (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_TIMEOUT, DB_POOL_PRE_PING) e tabela consultada
+db_tabela = os.getenv("DB_TABELA", TABELA_RECEBIMENTOS)
+
+# Carga: agregação no banco (padrão) ou leitura das linhas brutas em lotes de DB_TAMANHO_LOTE agregadas em pandas
+opcoes_carga = {
+    'no_banco': os.getenv("DB_AGREGAR_NO_BANCO", "true").lower() in ("1", "true", "sim"),
+    'tamanho_lote': int(os.getenv("DB_TAMANHO_LOTE", TAMANHO_LOTE_PADRAO)),
+}
+
+# Sincronização incremental: intervalo em segundos (0 desativa) e coluna opcional de última alteração
+sync_intervalo = int(os.getenv("SYNC_INTERVALO", INTERVALO_PADRAO))
+sync_coluna_atualizacao = os.getenv("SYNC_COLUNA_ATUALIZACAO")
+
+# Várias fontes (um schema por rede de clínicas), carregadas em paralelo: "nome=schema.tabela[:timeout], ..."
+# (vazio usa só DB_TABELA) e prazo padrão de cada uma em segundos
+db_fontes = ler_fontes(os.getenv("DB_FONTES", ""), float(os.getenv("DB_FONTES_TIMEOUT", TIMEOUT_PADRAO)))
+
+# Diretório do snapshot Parquet local (vazio desativa)
+snapshot_dir = os.getenv("SNAPSHOT_DIR", DIRETORIO_PADRAO)
+
+# Agregado compartilhado entre os processos do host (Arrow IPC com memory mapping): só um processo consulta o banco
+compartilhado_ativo = os.getenv("DASHBOARD_COMPARTILHADO", "false").lower() in ("1", "true", "sim")
+compartilhado_dir = os.getenv("COMPARTILHADO_DIR", COMPARTILHADO_PADRAO)
+
+# Tamanho máximo do cache de gráficos renderizados (MB)
+graficos_cache_mb = int(os.getenv("GRAFICOS_CACHE_MB", LIMITE_BYTES_PADRAO // (1024 * 1024)))
+
+# Instrumentação opcional das etapas (tempo, linhas, cache, memória) e arquivo de métricas no formato do Prometheus
+profiling_ativo = os.getenv("DASHBOARD_PROFILING", "false").lower() in ("1", "true", "sim")
+prometheus_arquivo = os.getenv("PROMETHEUS_ARQUIVO")  # aceita {pid} para um arquivo por processo
+if profiling_ativo:
+    configurar_log()
 
 # Definir localização brasileira para formatação de valores
 try:
@@ -29,23 +63,116 @@ try:
 except locale.Error:
     print("A localidade pt_BR.UTF-8 não está disponível no sistema.")
 
-# Função para formatar valores monetários brasileiros
-def format_currency_br(value):
-    return format_currency(value, 'BRL', locale='pt_BR')
-
-# Defina a função de conexão e obtenção de dados
-@st.cache_data
-def get_data():
-    # Configura a string de conexão ao banco 'telemedicina'
-    postgres_str = f'postgresql+pg8000://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}'
-    engine = create_engine(postgres_str)
-
-    # Consultar a tabela "recebimentos"
-    query = "SELECT * FROM telemedicina.recebimentos" 
-    with engine.connect() as connection:
-        df = pd.read_sql(query, connection)
-    
-    return df
+# Engine única por processo, com o pool de conexões configurado pelo .env
+@st.cache_resource
+def get_engine():
+    return criar_engine()
+
+# Estado da sincronização com o banco, compartilhado entre as sessões do processo
+# (`_medida` só é preenchido quando a função de fato executa, isto é, numa falha de cache)
+@st.cache_resource
+def get_sincronizacao(_medida=None):
+    if _medida is not None:
+        _medida['cache'] = "falha"
+    engine = get_engine()
+
+    # Carga completa da tabela "recebimentos" já agregada por mês, categoria e produto
+    return criar_sincronizacao(engine, db_tabela, sync_intervalo, sync_coluna_atualizacao, snapshot_dir, opcoes_carga)
+
+# Estado das várias fontes, compartilhado entre as sessões do processo
+@st.cache_resource
+def get_fontes(_medida=None):
+    if _medida is not None:
+        _medida['cache'] = "falha"
+    return criar_fontes(get_engine(), db_fontes, sync_intervalo, sync_coluna_atualizacao, snapshot_dir, opcoes_carga)
+
+# Estado do agregado compartilhado entre processos (lock de escritor e última versão aberta)
+@st.cache_resource
+def get_compartilhado():
+    estado = criar_compartilhado(compartilhado_dir)
+    if sync_intervalo:
+        iniciar_atualizador(estado, carregar_dados, sync_intervalo)
+    return estado
+
+# Carga pelo próprio processo: devolve (agregado, versão), buscando só o que mudou no banco.
+# Com DB_FONTES o agregado junta as fontes já carregadas, com a coluna FONTE.
+def carregar_dados(medida=None):
+    if db_fontes:
+        return coletar(get_fontes(medida))
+    return sincronizar(get_sincronizacao(medida))
+
+# Defina a função de conexão e obtenção de dados. Com DASHBOARD_COMPARTILHADO só o processo escritor carrega
+# do banco; os demais leem a versão publicada por ele.
+def get_data(medida=None):
+    if compartilhado_ativo:
+        return obter_compartilhado(get_compartilhado(), lambda: carregar_dados(medida))
+    return carregar_dados(medida)
+
+# Estado das fontes, só no processo que carrega do banco (os leitores do agregado compartilhado não o criam)
+def fontes_locais():
+    if db_fontes and (not compartilhado_ativo or get_compartilhado()['escritor']):
+        return get_fontes()
+    return None
+
+# Cubo (período, categoria, produto) construído uma vez por versão dos dados e compartilhado entre as sessões
+# (`fonte` restringe a uma das fontes; None soma todas)
+@st.cache_resource(max_entries=2)
+def get_cubo(_dados, versao_dados, fonte=None, _medida=None):
+    if _medida is not None:
+        _medida['cache'] = "falha"
+    if fonte is not None:
+        _dados = _dados[_dados['FONTE'] == fonte]
+    return construir_cubo(_dados)
+
+# Cache de gráficos já renderizados, compartilhado entre as sessões do processo
+@st.cache_resource
+def get_cache_graficos():
+    return criar_cache_graficos(limite_bytes=graficos_cache_mb * 1024 * 1024)
+
+# Variações MoM, YoY e da janela móvel de todos os meses, calculadas uma vez por versão dos dados, fonte e categoria
+@st.cache_data(max_entries=32)
+def get_tendencia(_cubo, versao_dados, fonte, categoria, _medida=None):
+    if _medida is not None:
+        _medida['cache'] = "falha"
+    por_categoria = calcular_variacoes(painel_do_cubo(_cubo, 'CATEGORIA', categoria))
+    total = calcular_variacoes(painel_do_cubo(_cubo, None, categoria))
+    return por_categoria, total
+
+# Agregado diário das tabelas da fonte (todas as tabelas ou só `meses`), para o índice do detalhamento
+def carregar_diario(tabelas, meses=None):
+    with get_engine().connect() as connection:
+        return combinar_diarios([carregar_agregado(connection, tabela, meses=meses, granularidade='dia', **opcoes_carga)
+                                 for tabela in tabelas])
+
+# Com SYNC_COLUNA_ATUALIZACAO: meses alterados nas tabelas desde a marca (uma por tabela) e a nova marca.
+# Sem marca anterior, ou com uma tabela ainda vazia, os meses voltam None para forçar a releitura completa.
+def alterados_diario(tabelas, marca):
+    with get_engine().connect() as connection:
+        nova_marca = tuple(ler_marca_atualizacao(connection, tabela, sync_coluna_atualizacao) for tabela in tabelas)
+        if marca is None or any(valor is None for valor in marca):
+            return None, nova_marca
+        meses = {mes for tabela, valor in zip(tabelas, marca) for mes in meses_alterados(connection, tabela, sync_coluna_atualizacao, valor)}
+    return sorted(meses), nova_marca
+
+# Detalhamento categoria -> produto -> dia, um por conjunto de tabelas (todas as fontes ou cada uma), lido do banco
+# só quando alguém abre o detalhamento; a cada nova versão dos dados só os meses que a sincronização relê
+# (e os que mudaram no agregado mensal) são relidos, com uma releitura completa periódica.
+# Mesmo com DASHBOARD_COMPARTILHADO ele é lido do banco em cada processo, não do agregado compartilhado.
+@st.cache_resource(max_entries=16)
+def get_detalhamento(tabelas, _medida=None):
+    if _medida is not None:
+        _medida['cache'] = "falha"
+    return criar_detalhamento()
+
+# Fila de geração de PDFs em segundo plano, compartilhada entre as sessões do processo
+@st.cache_resource
+def get_fila_relatorios():
+    return criar_fila_relatorios()
+
+# Métricas de desempenho acumuladas no processo
+@st.cache_resource
+def get_metricas():
+    return criar_metricas()
 
 # Configurando o título da página e outros elementos
 st.set_page_config(
@@ -54,16 +181,43 @@ st.set_page_config(
     initial_sidebar_state="expanded"  # Sidebar expandida inicialmente com opção de fechamento
 )
 
+# Registro das etapas desta execução (vazio se a instrumentação estiver desligada)
+registro = novo_registro(profiling_ativo)
+
 # Lendo e preparando dados
-dados = get_data()
-dados['DATA'] = pd.to_datetime(dados['DATA'], errors='coerce')  # Convertendo a coluna 'DATA' para o tipo datetime
+with medir_etapa(registro, "get_data") as medida:
+    medida['cache'] = "acerto"
+    dados, versao_dados = get_data(medida)  # Uma linha por mês (PERIODO), categoria e produto (e fonte, com DB_FONTES)
+    medida['linhas'] = 0 if dados is None else len(dados)
 
 # Simplificação no layout - Logo em fundo claro e menor
 st.image("../images/CV_FamiliaSaude1.png", width=100)
 
+# Fontes que ainda não responderam ou falharam: o dashboard segue com as que já chegaram
+estado_fontes = fontes_locais()
+if estado_fontes is not None:
+    situacao = situacao_fontes(estado_fontes)
+    fora = {nome: estado for nome, estado in situacao.items() if estado != "ok"}
+    if fora:
+        st.warning("Fontes fora desta visão: " + "; ".join(f"{nome} ({estado})" for nome, estado in fora.items()))
+if dados is None:
+    st.info("Os dados ainda estão sendo carregados. Atualize a página em instantes.")
+    st.stop()
+
 # Configuração simplificada da sidebar - escondendo seção de cabeçalho e filtrando ano/mês com opções diretas
 st.sidebar.title("Filtros")
 
+# Filtro de fonte (só com DB_FONTES), aplicado na construção do cubo
+filtro_fonte = "Todas"
+if db_fontes:
+    filtro_fonte = st.sidebar.selectbox("Fonte:", options=["Todas"] + list(dados['FONTE'].cat.categories), key="filtro_fonte")
+fonte_selecionada = None if filtro_fonte == "Todas" else filtro_fonte
+
+with medir_etapa(registro, "cubo") as medida:
+    medida['cache'] = "acerto"
+    cubo = get_cubo(dados, versao_dados, fonte_selecionada, medida)
+    medida['linhas'] = len(dados)
+
 # Define os valores padrão do filtro de meses com base na data atual do sistema
 mes_referencia = datetime.now().month
 ano_referencia = datetime.now().year
@@ -76,24 +230,31 @@ mes_padrao_anterior = mes_padrao_atual - 1 if mes_padrao_atual > 1 else 12
 ano_padrao_anterior = ano_padrao_atual if mes_padrao_atual > 1 else ano_padrao_atual - 1
 
 # Filtro de categoria com "Todos" como opção
-lista_categorias = ["Todos"] + sorted(dados['CATEGORIA'].str.title().unique())
+lista_categorias = ["Todos"] + list(cubo['categorias'])
 filtro_categoria = st.sidebar.selectbox("Categoria:", options=lista_categorias, key="filtro_categoria")
 
 # Configuração dos seletores de ano e mês para o mês atual e anterior
+lista_anos = anos_disponiveis(cubo)
 st.sidebar.subheader("Período de Referência")
-filtro_ano_atual = st.sidebar.selectbox("Ano:", options=sorted(dados['DATA'].dt.year.unique()), 
-                                        index=sorted(dados['DATA'].dt.year.unique()).index(ano_padrao_atual), key="filtro_ano_atual")
+filtro_ano_atual = st.sidebar.selectbox("Ano:", options=lista_anos, 
+                                        index=lista_anos.index(ano_padrao_atual), key="filtro_ano_atual")
 filtro_mes_atual = st.sidebar.selectbox("Mês:", options=list(range(1, 13)),
                                         format_func=lambda x: calendar.month_name[x].capitalize(),
                                         index=mes_padrao_atual - 1, key="filtro_mes_atual")
 
 st.sidebar.subheader("Período Anterior")
-filtro_ano_anterior = st.sidebar.selectbox("Ano:", options=sorted(dados['DATA'].dt.year.unique()),
-                                           index=sorted(dados['DATA'].dt.year.unique()).index(ano_padrao_anterior), key="filtro_ano_anterior")
+filtro_ano_anterior = st.sidebar.selectbox("Ano:", options=lista_anos,
+                                           index=lista_anos.index(ano_padrao_anterior), key="filtro_ano_anterior")
 filtro_mes_anterior = st.sidebar.selectbox("Mês:", options=list(range(1, 13)),
                                            format_func=lambda x: calendar.month_name[x].capitalize(),
                                            index=mes_padrao_anterior - 1, key="filtro_mes_anterior")
 
+# Gráfico de produtos: só os N de maior variação, com o restante somado em "Outros"
+st.sidebar.subheader("Gráfico de Produtos")
+filtro_top_n = st.sidebar.slider("Produtos destacados:", min_value=5, max_value=50, value=N_PADRAO, step=5, key="filtro_top_n")
+filtro_modo_top = st.sidebar.radio("Destacar:", options=['absoluta', 'altas', 'quedas'], key="filtro_modo_top",
+                                   format_func={'absoluta': "Maiores variações", 'altas': "Maiores altas", 'quedas': "Maiores quedas"}.get)
+
 
 # Validação para garantir que o mês anterior não seja mais recente do que o mês atual
 data_atual = datetime(filtro_ano_atual, filtro_mes_atual, 1)
@@ -105,11 +266,8 @@ if data_anterior >= data_atual:
     filtro_mes_anterior = filtro_mes_atual - 1 if filtro_mes_atual > 1 else 12
     filtro_ano_anterior = filtro_ano_atual if filtro_mes_atual > 1 else filtro_ano_atual - 1
 
-# Filtra os dados pela categoria selecionada
-if filtro_categoria == "Todos":
-    dados_filtrados = dados
-else:
-    dados_filtrados = dados[dados['CATEGORIA'].str.title() == filtro_categoria]
+# Categoria selecionada (None = todas) para as leituras no cubo
+categoria_selecionada = None if filtro_categoria == "Todos" else filtro_categoria
 
 # Cabeçalho minimalista
 with st.container():
@@ -118,9 +276,11 @@ with st.container():
     st.markdown("<hr style='border-color: lightgray;'>", unsafe_allow_html=True)
 
 # Calcular valores totais e variação percentual
-recebimento_mes_atual = dados[(dados['DATA'].dt.year == ano_padrao_atual) & (dados['DATA'].dt.month == filtro_mes_atual)]['TOTAL_RECEBIDO'].sum()
-recebimento_mes_anterior = dados[(dados['DATA'].dt.year == filtro_ano_anterior) & (dados['DATA'].dt.month == filtro_mes_anterior)]['TOTAL_RECEBIDO'].sum()
-variacao_percentual = ((recebimento_mes_atual - recebimento_mes_anterior) / recebimento_mes_anterior * 100) if recebimento_mes_anterior else 0
+with medir_etapa(registro, "kpis"):
+    recebimento_mes_atual = total_periodo(cubo, filtro_ano_atual, filtro_mes_atual)
+    recebimento_mes_anterior = total_periodo(cubo, filtro_ano_anterior, filtro_mes_anterior)
+# Sem recebimento no mês anterior não há base de comparação: a variação fica NaN e aparece como "s/ base"
+variacao_total = float(variacao_percentual(recebimento_mes_atual, recebimento_mes_anterior))
 
 # Usando locale.format_string para formatar em português
 valor_formatado_mes_atual = locale.format_string("R$ %.2f", recebimento_mes_atual, grouping=True)
@@ -133,85 +293,208 @@ with col1:
 with col2:
     st.metric(label=f"Recebimento em {calendar.month_name[filtro_mes_atual]}/{filtro_ano_atual}", value=valor_formatado_mes_atual)
 with col3:
-    st.metric(label="Variação Percentual", value=f"{variacao_percentual:.2f}%")
-
-# Configuração de cores para os gráficos
-cores_graficos = plt.get_cmap('Pastel1').colors
-ciclo_cores = cycler('color', cores_graficos)
-plt.rc('axes', prop_cycle=ciclo_cores)
+    st.metric(label="Variação Percentual", value=formatar_variacao(variacao_total))
+
+# Comparação entre as fontes nos dois meses (só com DB_FONTES), lida do agregado mensal
+if db_fontes and fonte_selecionada is None:
+    with medir_etapa(registro, "comparação fontes") as medida:
+        periodos_comparados = [ordinal_mes(filtro_ano_atual, filtro_mes_atual), ordinal_mes(filtro_ano_anterior, filtro_mes_anterior)]
+        recorte_fontes = dados[dados['PERIODO'].isin(periodos_comparados)]
+        if categoria_selecionada is not None:
+            recorte_fontes = recorte_fontes[recorte_fontes['CATEGORIA'] == categoria_selecionada]
+        por_fonte = (recorte_fontes.groupby(['FONTE', 'PERIODO'], observed=False)['TOTAL_RECEBIDO'].sum()
+                     .unstack(fill_value=0).reindex(columns=periodos_comparados, fill_value=0) / 100)
+        comparacao_fontes = variacao(por_fonte[periodos_comparados[0]], por_fonte[periodos_comparados[1]])
+        medida['linhas'] = len(recorte_fontes)
+    st.dataframe(pd.DataFrame({
+        'Fonte': comparacao_fontes['FONTE'],
+        f"{calendar.month_name[filtro_mes_anterior]}/{filtro_ano_anterior}": comparacao_fontes['ANTERIOR'].map(lambda valor: locale.format_string("R$ %.2f", valor, grouping=True)),
+        f"{calendar.month_name[filtro_mes_atual]}/{filtro_ano_atual}": comparacao_fontes['ATUAL'].map(lambda valor: locale.format_string("R$ %.2f", valor, grouping=True)),
+        'Variação': comparacao_fontes['VARIACAO_PERCENTUAL'].map(formatar_variacao),
+    }), hide_index=True, use_container_width=True)
+
+# Chave dos gráficos: filtros selecionados e versão dos dados
+cache_graficos = get_cache_graficos()
+chave_graficos = (filtro_fonte, filtro_categoria, filtro_ano_atual, filtro_mes_atual, filtro_ano_anterior, filtro_mes_anterior, versao_dados)
 
 # Gráfico 1: Variação Percentual por Categoria
 st.write('---')
 st.markdown("<h2 style='color: gray; font-size: 20px;'>Variação Percentual por Categoria</h2>", unsafe_allow_html=True)
 
-# Filtrando dados e calculando variação por categoria
-dados_mes_anterior_categoria = dados_filtrados[(dados['DATA'].dt.year == filtro_ano_anterior) & (dados['DATA'].dt.month == filtro_mes_anterior)]
-dados_mes_atual_categoria = dados_filtrados[(dados['DATA'].dt.year == filtro_ano_atual) & (dados['DATA'].dt.month == filtro_mes_atual)]
-
-recebimento_categoria_mes_anterior = dados_mes_anterior_categoria.groupby('CATEGORIA')['TOTAL_RECEBIDO'].sum()
-recebimento_categoria_mes_atual = dados_mes_atual_categoria.groupby('CATEGORIA')['TOTAL_RECEBIDO'].sum()
+# Lendo o recebimento por categoria no cubo e calculando a variação
+with medir_etapa(registro, "variação categoria") as medida:
+    dados_porcentagem_categoria = variacao(recebimento_por_categoria(cubo, filtro_ano_atual, filtro_mes_atual),
+                                           recebimento_por_categoria(cubo, filtro_ano_anterior, filtro_mes_anterior))
+    if categoria_selecionada is not None:
+        dados_porcentagem_categoria = dados_porcentagem_categoria[dados_porcentagem_categoria['CATEGORIA'] == categoria_selecionada]
+    medida['linhas'] = len(dados_porcentagem_categoria)
 
-porcentagem_categoria = (recebimento_categoria_mes_atual - recebimento_categoria_mes_anterior) / recebimento_categoria_mes_anterior * 100
-dados_porcentagem_categoria = porcentagem_categoria.reset_index()
-dados_porcentagem_categoria.columns = ['CATEGORIA', 'VARIACAO_PERCENTUAL']
-dados_porcentagem_categoria['VARIACAO_PERCENTUAL'] = pd.to_numeric(dados_porcentagem_categoria['VARIACAO_PERCENTUAL'], errors='coerce')
-
-fig_categoria, ax_categoria = plt.subplots(figsize=(12, 7))
-barras_categoria = ax_categoria.bar(dados_porcentagem_categoria['CATEGORIA'], dados_porcentagem_categoria['VARIACAO_PERCENTUAL'])
-
-ax_categoria.bar_label(barras_categoria, labels=[f"{var:.2f}%" for var in dados_porcentagem_categoria['VARIACAO_PERCENTUAL']], padding=3)
-for i, var in enumerate(dados_porcentagem_categoria['VARIACAO_PERCENTUAL']):
-    barras_categoria[i].set_color(cores_graficos[0] if var < 0 else cores_graficos[2])
-
-plt.box(False)
-ax_categoria.tick_params(axis='x', rotation=45, labelsize=10, pad=20, length=0)
-ax_categoria.set_yticks([])
-
-st.pyplot(fig_categoria)
+# Renderiza o gráfico só se essa combinação de filtros ainda não estiver no cache
+with medir_etapa(registro, "gráfico categoria") as medida:
+    imagem_categoria = obter_grafico(cache_graficos, ('categoria',) + chave_graficos, renderizar_grafico_categoria,
+                                     dados_porcentagem_categoria, medida=medida)
+st.image(imagem_categoria, use_column_width=True)
 
 # Gráfico 2: Variação Percentual por Produto
 st.write('---')
 st.markdown("<h2 style='color: gray; font-size: 20px;'>Variação Percentual por Produto</h2>", unsafe_allow_html=True)
 
-dados_mes_anterior_produto = dados_filtrados[(dados['DATA'].dt.year == filtro_ano_anterior) & (dados['DATA'].dt.month == filtro_mes_anterior)]
-dados_mes_atual_produto = dados_filtrados[(dados['DATA'].dt.year == filtro_ano_atual) & (dados['DATA'].dt.month == filtro_mes_atual)]
-
-recebimento_produto_mes_anterior = dados_mes_anterior_produto.groupby('ITEM_PCG')['TOTAL_RECEBIDO'].sum()
-recebimento_produto_mes_atual = dados_mes_atual_produto.groupby('ITEM_PCG')['TOTAL_RECEBIDO'].sum()
-
-porcentagem_produto = (recebimento_produto_mes_atual - recebimento_produto_mes_anterior) / recebimento_produto_mes_anterior * 100
-dados_porcentagem_produto = porcentagem_produto.reset_index()
-dados_porcentagem_produto.columns = ['ITEM_PCG', 'VARIACAO_PERCENTUAL']
-dados_porcentagem_produto['VARIACAO_PERCENTUAL'] = pd.to_numeric(dados_porcentagem_produto['VARIACAO_PERCENTUAL'], errors='coerce')
-
-fig_produto, ax_produto = plt.subplots(figsize=(12, 7))
-barras_produto = ax_produto.barh(dados_porcentagem_produto['ITEM_PCG'], dados_porcentagem_produto['VARIACAO_PERCENTUAL'])
-
-ax_produto.bar_label(barras_produto, labels=[f"{var:.2f}%" for var in dados_porcentagem_produto['VARIACAO_PERCENTUAL']], padding=3)
-for i, var in enumerate(dados_porcentagem_produto['VARIACAO_PERCENTUAL']):
-    barras_produto[i].set_color(cores_graficos[0] if var < 0 else cores_graficos[2])
-
-plt.box(False)
-ax_produto.tick_params(axis='y', labelsize=10, pad=30, length=0)
-ax_produto.set_xticks([])
-
-st.pyplot(fig_produto)
-
-# Exportar gráficos para PDF diretamente ao clicar no botão
-def gerar_pdf():
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    
-    # Adicionar textos e gráficos no PDF
-    c.drawString(100, 800, f"Recebimento mês atual ({filtro_mes_atual}/{filtro_ano_atual}): {valor_formatado_mes_atual}")
-    c.drawString(100, 780, f"Recebimento mês anterior ({filtro_mes_anterior}/{filtro_ano_anterior}): {valor_formatado_mes_anterior}")
-    c.drawString(100, 760, f"Variação percentual: {variacao_percentual:.2f}%")
-    
-    # Salvar PDF no buffer
-    c.save()
-    buffer.seek(0)
-    return buffer
-
-# Botão único para gerar e baixar o PDF
-buffer = gerar_pdf()
-st.download_button(label="Exportar para PDF", data=buffer, file_name="dashboard_variacao.pdf", mime="application/pdf")
\ No newline at end of file
+with medir_etapa(registro, "variação produto") as medida:
+    dados_porcentagem_produto = variacao(recebimento_por_produto(cubo, filtro_ano_atual, filtro_mes_atual, categoria_selecionada),
+                                         recebimento_por_produto(cubo, filtro_ano_anterior, filtro_mes_anterior, categoria_selecionada))
+    medida['linhas'] = len(dados_porcentagem_produto)
+    dados_grafico_produto = extremos(dados_porcentagem_produto, 'ITEM_PCG', filtro_top_n, filtro_modo_top)
+
+with medir_etapa(registro, "gráfico produto") as medida:
+    imagem_produto = obter_grafico(cache_graficos, ('produto', filtro_top_n, filtro_modo_top) + chave_graficos,
+                                   renderizar_grafico_produto, dados_grafico_produto, medida=medida)
+st.image(imagem_produto, use_column_width=True)
+
+# Detalhamento: produtos de uma categoria e, ao clicar em um produto, a sua série diária nos dois meses
+if st.toggle("Detalhar categoria por produto e dia", key="detalhar"):
+    with medir_etapa(registro, "índice diário") as medida:
+        medida['cache'] = "acerto"
+        try:
+            if estado_fontes is not None:
+                tabelas_indice = tabelas_fontes(estado_fontes, fonte_selecionada)
+            elif db_fontes:
+                tabelas_indice = tuple(fonte['tabela'] for fonte in db_fontes if fonte_selecionada in (None, fonte['nome']))
+            else:
+                tabelas_indice = (db_tabela,)
+            dados_indice = dados if fonte_selecionada is None else dados[dados['FONTE'] == fonte_selecionada]
+            indice = obter_indice(get_detalhamento(tabelas_indice, medida), dados_indice, versao_dados,
+                                  lambda meses: carregar_diario(tabelas_indice, meses),
+                                  (lambda marca: alterados_diario(tabelas_indice, marca)) if sync_coluna_atualizacao else None)
+        except SQLAlchemyError as erro:
+            indice = None
+            st.error(f"Não foi possível carregar o detalhamento diário: {erro}")
+
+    if indice is not None:
+        categorias_detalhe = list(dados_porcentagem_categoria['CATEGORIA'])
+        categoria_detalhe = st.selectbox("Categoria detalhada:", options=categorias_detalhe, key="categoria_detalhe",
+                                         index=categorias_detalhe.index(categoria_selecionada) if categoria_selecionada in categorias_detalhe else 0)
+        dias_atual = dias_do_mes(filtro_ano_atual, filtro_mes_atual)
+        dias_anterior = dias_do_mes(filtro_ano_anterior, filtro_mes_anterior)
+
+        with medir_etapa(registro, "detalhamento") as medida:
+            detalhe = variacao(produtos_da_categoria(indice, categoria_detalhe, *dias_atual),
+                               produtos_da_categoria(indice, categoria_detalhe, *dias_anterior))
+            medida['linhas'] = len(detalhe)
+
+        # Barras clicáveis: o produto escolhido volta na seleção do gráfico
+        selecao = alt.selection_point(name="produto", fields=['ITEM_PCG'])
+        grafico_detalhe = alt.Chart(detalhe).mark_bar().encode(
+            x=alt.X('VARIACAO_PERCENTUAL:Q', title="Variação (%)"),
+            y=alt.Y('ITEM_PCG:N', sort='-x', title=None),
+            color=alt.condition(selecao, alt.value("#4c78a8"), alt.value("#c7c7c7")),
+            tooltip=['ITEM_PCG', 'ANTERIOR', 'ATUAL', 'VARIACAO_PERCENTUAL'],
+        ).add_params(selecao)
+        evento = st.altair_chart(grafico_detalhe, use_container_width=True, on_select="rerun", key="grafico_detalhe")
+
+        produtos_clicados = evento.selection.get("produto", [])
+        if produtos_clicados:
+            produto_detalhe = produtos_clicados[0]['ITEM_PCG']
+            with medir_etapa(registro, "série diária"):
+                serie_atual = serie_diaria(indice, categoria_detalhe, produto_detalhe, *dias_atual)
+                serie_anterior = serie_diaria(indice, categoria_detalhe, produto_detalhe, *dias_anterior)
+            st.markdown(f"**{produto_detalhe}**: recebimento diário")
+            # Os dois meses lado a lado pelo dia do mês
+            st.line_chart(pd.DataFrame({
+                f"{filtro_mes_atual:02d}/{filtro_ano_atual}": serie_atual.set_axis(serie_atual.index.day),
+                f"{filtro_mes_anterior:02d}/{filtro_ano_anterior}": serie_anterior.set_axis(serie_anterior.index.day),
+            }).rename_axis("Dia"))
+        else:
+            st.caption("Clique em um produto para ver o recebimento diário.")
+
+# Tendência: evolução mensal e variações dos últimos 12 ou 24 meses até o mês de referência
+st.write('---')
+st.markdown("<h2 style='color: gray; font-size: 20px;'>Tendência de Recebimento</h2>", unsafe_allow_html=True)
+
+meses_tendencia = st.radio("Período:", options=[12, 24], format_func=lambda x: f"{x} meses", horizontal=True, key="meses_tendencia")
+with medir_etapa(registro, "tendência") as medida:
+    medida['cache'] = "acerto"
+    tendencia_categoria, tendencia_total = get_tendencia(cubo, versao_dados, fonte_selecionada, categoria_selecionada, medida)
+ultimo_mes = ordinal_mes(filtro_ano_atual, filtro_mes_atual)
+
+def recorte_tendencia(tendencia):
+    recorte = tendencia[(tendencia['PERIODO'] > ultimo_mes - meses_tendencia) & (tendencia['PERIODO'] <= ultimo_mes)].copy()
+    recorte['MES'] = pd.to_datetime({'year': recorte['PERIODO'] // 12, 'month': recorte['PERIODO'] % 12 + 1, 'day': 1})
+    return recorte
+
+st.line_chart(recorte_tendencia(tendencia_categoria).pivot(index='MES', columns='CATEGORIA', values='VALOR'))
+
+tabela_tendencia = recorte_tendencia(tendencia_total)
+st.dataframe(pd.DataFrame({
+    'Mês': tabela_tendencia['MES'].dt.strftime('%m/%Y'),
+    'Recebimento': tabela_tendencia['VALOR'].map(lambda valor: locale.format_string("R$ %.2f", valor, grouping=True)),
+    'Variação mensal': tabela_tendencia['VAR_MOM'].map(formatar_variacao),
+    'Variação anual': tabela_tendencia['VAR_YOY'].map(formatar_variacao),
+    'Variação trimestral': tabela_tendencia['VAR_JANELA'].map(formatar_variacao),
+}), hide_index=True, use_container_width=True)
+
+# Exportar gráficos para PDF: o relatório é gerado em segundo plano e reaproveitado por filtros e versão dos dados
+fila_relatorios = get_fila_relatorios()
+resumo_pdf = {
+    'mes_atual': filtro_mes_atual, 'ano_atual': filtro_ano_atual, 'valor_atual': valor_formatado_mes_atual,
+    'mes_anterior': filtro_mes_anterior, 'ano_anterior': filtro_ano_anterior, 'valor_anterior': valor_formatado_mes_anterior,
+    'variacao': variacao_total, 'categoria': filtro_categoria,
+}
+argumentos_pdf = (resumo_pdf, imagem_categoria, imagem_produto, dados_porcentagem_categoria, dados_porcentagem_produto)
+chave_relatorio = (filtro_top_n, filtro_modo_top) + chave_graficos  # o gráfico de produtos no PDF depende do recorte
+
+# O relatório do período padrão é adiantado assim que a página abre
+periodo_padrao = (filtro_categoria == "Todos" and (filtro_ano_atual, filtro_mes_atual) == (ano_padrao_atual, mes_padrao_atual)
+                  and (filtro_ano_anterior, filtro_mes_anterior) == (ano_padrao_anterior, mes_padrao_anterior))
+if periodo_padrao:
+    solicitar_relatorio(fila_relatorios, chave_relatorio, *argumentos_pdf)
+
+futuro_pdf = consultar_relatorio(fila_relatorios, chave_relatorio)
+pedido_pdf = futuro_pdf is None and st.button("Gerar PDF")
+if pedido_pdf:
+    futuro_pdf = solicitar_relatorio(fila_relatorios, chave_relatorio, *argumentos_pdf)
+
+# Botão único para baixar o PDF quando ele estiver pronto
+def botao_pdf(futuro):
+    if futuro.exception() is not None:
+        st.error(f"Não foi possível gerar o PDF: {futuro.exception()}")
+    else:
+        st.download_button(label="Exportar para PDF", data=futuro.result(), file_name="dashboard_variacao.pdf", mime="application/pdf")
+
+# Enquanto o PDF adiantado não fica pronto, só este trecho da página é reexecutado, a cada 2 segundos.
+# Quando fica pronto, a página inteira é reexecutada: o botão sai pelo caminho normal e o fragmento deixa de existir.
+@st.fragment(run_every=2)
+def aguardar_pdf(futuro):
+    if futuro.done():
+        st.rerun()
+    st.caption("Gerando PDF em segundo plano...")
+
+if futuro_pdf is not None:
+    with medir_etapa(registro, "pdf") as medida:
+        medida['cache'] = "acerto" if futuro_pdf.done() else "falha"
+        # Só quem clicou em "Gerar PDF" espera; o relatório adiantado não segura a página
+        if pedido_pdf:
+            with st.spinner("Gerando PDF..."):
+                futuro_pdf.exception()
+    if futuro_pdf.done():
+        botao_pdf(futuro_pdf)
+    else:
+        aguardar_pdf(futuro_pdf)
+
+# Painel de desempenho desta execução e percentis acumulados no processo
+if registro['ativo']:
+    metricas = get_metricas()
+    registrar(metricas, registro)
+    if prometheus_arquivo:
+        exportar_prometheus(metricas, prometheus_arquivo.format(pid=os.getpid()))
+
+    p50_p95 = percentis(metricas)
+    with st.sidebar.expander("Desempenho"):
+        st.dataframe(pd.DataFrame([{
+            'Etapa': medida['etapa'],
+            'ms': round(medida['segundos'] * 1000, 2),
+            'p50 ms': round(p50_p95[medida['etapa']][0] * 1000, 2),
+            'p95 ms': round(p50_p95[medida['etapa']][1] * 1000, 2),
+            'Linhas': medida.get('linhas'),
+            'Cache': medida.get('cache'),
+            'Δ RSS MB': round(medida['memoria_delta_mb'], 1),
+        } for medida in registro['etapas']]), hide_index=True)
@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from conexao import criar_engine
+from consultas import agregar_dataframe, ano_mes, carregar_agregado, normalizar_agregado
+from cubo import (construir_cubo, extremos, indice_categoria, painel_do_cubo, recebimento_por_categoria, recebimento_por_produto,
+                  total_periodo, variacao)
+from dados_sinteticos import linhas_do_tamanho
+from graficos import renderizar_grafico_categoria, renderizar_grafico_produto
+from relatorio import format_currency_br, gerar_pdf
+from variacao import calcular_variacoes, variacao_percentual
+
+# Benchmark do pipeline do dashboard sobre dados sintéticos (SQLite ou Parquet).
+# Mede cada etapa separadamente (mediana e mínimo de N repetições, e o pico de memória alocado pela etapa)
+# e grava um JSON que pode ser comparado com uma execução anterior para detectar regressões.
+# Os dados são gerados num processo à parte, para que a geração não pese na memória medida.
+#
+# Exemplo:
+#   python benchmark.py --linhas 1m --fonte sqlite --saida bench_1m.json
+#   python benchmark.py --linhas 1m --fonte sqlite --comparar bench_1m.json
+
+# Mês final fixo dos dados gerados, para que as execuções sejam comparáveis
+FIM_PADRAO = "2025-01"
+TOLERANCIA_PADRAO = 0.2
+TOLERANCIA_MEMORIA_PADRAO = 0.2
+
+# Etapas com menos memória que isto (MB) são comparadas como se usassem este tanto, para não acusar ruído
+MEMORIA_MINIMA_MB = 1.0
+
+
+# Pico de memória residente do processo inteiro até agora (MB), só para referência no JSON
+def pico_memoria_mb():
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+
+
+# Pico de memória alocado (MB) durante uma execução da etapa, acima do que já estava alocado antes dela.
+# O tracemalloc vê as alocações do Python, do numpy e do pandas; do Arrow, que aloca fora dele,
+# soma-se o que a etapa deixou alocado no pool (ex.: a tabela lida do Parquet).
+def memoria_da_etapa(funcao):
+    arrow_antes = pa.total_allocated_bytes()
+    tracemalloc.start()
+    try:
+        antes = tracemalloc.get_traced_memory()[0]
+        retorno = funcao()
+        pico = tracemalloc.get_traced_memory()[1]
+        arrow = max(pa.total_allocated_bytes() - arrow_antes, 0)
+    finally:
+        tracemalloc.stop()
+    del retorno
+    return (pico - antes + arrow) / (1024 * 1024)
+
+
+# Executa a etapa `repeticoes` vezes e registra mediana e mínimo; a memória é medida numa execução extra,
+# porque o tracemalloc deixa as alocações mais lentas e distorceria os tempos. Devolve o último resultado.
+def medir(resultados, etapa, funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        retorno = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    resultados[etapa] = {
+        'mediana_s': statistics.median(tempos),
+        'minimo_s': min(tempos),
+        'pico_memoria_mb': memoria_da_etapa(funcao),
+    }
+    print(f"{etapa:>32}: {resultados[etapa]['mediana_s'] * 1000:10.2f} ms  (pico {resultados[etapa]['pico_memoria_mb']:.1f} MB)")
+    return retorno
+
+
+# Etapas de carga a partir do SQLite: agregação no banco e ingestão em lotes
+def medir_carga_sqlite(resultados, caminho, repeticoes, tamanho_lote):
+    engine = criar_engine(f"sqlite:///{caminho}")
+    with engine.connect() as connection:
+        agregado = medir(resultados, "carga (GROUP BY no banco)",
+                         lambda: carregar_agregado(connection, "recebimentos"), repeticoes)
+        medir(resultados, "carga (lotes em pandas)",
+              lambda: carregar_agregado(connection, "recebimentos", no_banco=False, tamanho_lote=tamanho_lote), repeticoes)
+    return agregado
+
+
+# Etapas de carga a partir do Parquet: leitura, conversão de datas e agregação em pandas
+def medir_carga_parquet(resultados, caminho, repeticoes):
+    brutos = medir(resultados, "leitura parquet", lambda: pq.read_table(caminho, memory_map=True).to_pandas(), repeticoes)
+    datas = medir(resultados, "conversão de datas", lambda: pd.to_datetime(brutos['DATA']), repeticoes)
+    brutos['DATA'] = datas
+    return medir(resultados, "agregação pandas", lambda: normalizar_agregado(agregar_dataframe(brutos)), repeticoes)
+
+
+# Etapas por interação do dashboard, sobre o último par de meses dos dados
+def medir_interacao(resultados, agregado, repeticoes):
+    cubo = medir(resultados, "cubo", lambda: construir_cubo(agregado), repeticoes)
+    ordinais = sorted(cubo['periodos'])
+    (ano_atual, mes_atual), (ano_anterior, mes_anterior) = ano_mes(ordinais[-1]), ano_mes(ordinais[-2])
+    categoria = cubo['categorias'][0]
+
+    medir(resultados, "filtro categoria", lambda: indice_categoria(cubo, categoria), repeticoes)
+    totais = medir(resultados, "kpis", lambda: (total_periodo(cubo, ano_atual, mes_atual),
+                                                total_periodo(cubo, ano_anterior, mes_anterior)), repeticoes)
+    dados_categoria = medir(resultados, "variação categoria", lambda: variacao(
+        recebimento_por_categoria(cubo, ano_atual, mes_atual), recebimento_por_categoria(cubo, ano_anterior, mes_anterior)), repeticoes)
+    dados_produto = medir(resultados, "variação produto", lambda: variacao(
+        recebimento_por_produto(cubo, ano_atual, mes_atual), recebimento_por_produto(cubo, ano_anterior, mes_anterior)), repeticoes)
+    medir(resultados, "tendência", lambda: calcular_variacoes(painel_do_cubo(cubo, 'CATEGORIA')), repeticoes)
+    imagem_categoria = medir(resultados, "gráfico categoria", lambda: renderizar_grafico_categoria(dados_categoria), repeticoes)
+    imagem_produto = medir(resultados, "gráfico produto", lambda: renderizar_grafico_produto(extremos(dados_produto, 'ITEM_PCG')), repeticoes)
+
+    resumo = {
+        'mes_atual': mes_atual, 'ano_atual': ano_atual, 'valor_atual': format_currency_br(totais[0]),
+        'mes_anterior': mes_anterior, 'ano_anterior': ano_anterior, 'valor_anterior': format_currency_br(totais[1]),
+        'variacao': float(variacao_percentual(totais[0], totais[1])), 'categoria': "Todos",
+    }
+    medir(resultados, "pdf", lambda: gerar_pdf(resumo, imagem_categoria, imagem_produto, dados_categoria, dados_produto), repeticoes)
+
+
+# Compara com uma execução anterior; devolve as etapas que ficaram mais lentas ou usaram mais memória
+# que as tolerâncias. Execuções com outro volume de dados ou outra fonte não são comparáveis (ValueError).
+def comparar(resultados, linhas, fonte, caminho_base, tolerancia, tolerancia_memoria):
+    with open(caminho_base) as arquivo:
+        base = json.load(arquivo)
+    if (base.get('linhas'), base.get('fonte')) != (linhas, fonte):
+        raise ValueError(f"{caminho_base} foi medido com {base.get('linhas')} linhas ({base.get('fonte')}), "
+                         f"não com {linhas} linhas ({fonte})")
+
+    regressoes = []
+    for etapa, medida in resultados.items():
+        if etapa not in base['etapas']:
+            continue
+        anterior = base['etapas'][etapa]
+        razao = medida['mediana_s'] / max(anterior['mediana_s'], 1e-9)
+        razao_memoria = (max(medida['pico_memoria_mb'], MEMORIA_MINIMA_MB)
+                         / max(anterior['pico_memoria_mb'], MEMORIA_MINIMA_MB))
+        marcador = "  <-- regressão" if razao > 1 + tolerancia or razao_memoria > 1 + tolerancia_memoria else ""
+        print(f"{etapa:>32}: {razao:6.2f}x tempo  {razao_memoria:6.2f}x memória{marcador}")
+        if marcador:
+            regressoes.append(etapa)
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline do dashboard sobre dados sintéticos.")
+    parser.add_argument("--linhas", default="10k", help="10k, 1m, 50m ou um número de linhas")
+    parser.add_argument("--fonte", choices=["sqlite", "parquet"], default="sqlite")
+    parser.add_argument("--dados", help="Arquivo de dados já gerado (padrão: gera em ../cache/bench_<linhas>.<fonte>)")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--tamanho-lote", type=int, default=100_000)
+    parser.add_argument("--saida", help="Grava os resultados em JSON")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparação")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_PADRAO, help="Aumento relativo de tempo aceito antes de acusar regressão")
+    parser.add_argument("--tolerancia-memoria", type=float, default=TOLERANCIA_MEMORIA_PADRAO,
+                        help="Aumento relativo de memória aceito antes de acusar regressão")
+    args = parser.parse_args()
+
+    extensao = "db" if args.fonte == "sqlite" else "parquet"
+    caminho = args.dados or os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache", f"bench_{args.linhas}.{extensao}")
+    if not os.path.exists(caminho):
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        inicio = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados_sinteticos.py"),
+                        "--linhas", args.linhas, "--destino", caminho, "--fim", FIM_PADRAO], check=True)
+        print(f"Dados gerados em {caminho} ({time.perf_counter() - inicio:.1f}s)")
+
+    resultados = {}
+    if args.fonte == "sqlite":
+        agregado = medir_carga_sqlite(resultados, caminho, args.repeticoes, args.tamanho_lote)
+    else:
+        agregado = medir_carga_parquet(resultados, caminho, args.repeticoes)
+    medir_interacao(resultados, agregado, args.repeticoes)
+
+    linhas = linhas_do_tamanho(args.linhas)
+    if args.saida:
+        with open(args.saida, "w") as arquivo:
+            json.dump({
+                'linhas': linhas, 'fonte': args.fonte, 'repeticoes': args.repeticoes,
+                'python': platform.python_version(), 'pandas': pd.__version__, 'plataforma': platform.platform(),
+                'pico_memoria_processo_mb': pico_memoria_mb(), 'etapas': resultados,
+            }, arquivo, indent=2, ensure_ascii=False)
+
+    if args.comparar:
+        try:
+            regressoes = comparar(resultados, linhas, args.fonte, args.comparar, args.tolerancia, args.tolerancia_memoria)
+        except ValueError as erro:
+            print(f"Comparação recusada: {erro}")
+            sys.exit(2)
+        if regressoes:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import fcntl
+import json
+import os
+import threading
+import time
+import pyarrow as pa
+from sqlalchemy.exc import SQLAlchemyError
+
+# Agregado compartilhado entre os processos do Streamlit no mesmo host: um único processo (o escritor, eleito por
+# um lock de arquivo) carrega e sincroniza o banco e publica cada versão como arquivo Arrow IPC; os demais abrem
+# o arquivo com memory mapping, então as páginas ficam uma vez só na memória do host e todos veem a mesma versão.
+
+# Em /dev/shm o arquivo fica só em memória; fora do Linux usa o diretório de cache do projeto
+DIRETORIO_PADRAO = ("/dev/shm/dashboard-recebimentos" if os.path.isdir("/dev/shm")
+                    else os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache", "compartilhado"))
+
+# Ponteiro para a versão vigente e arquivo de lock do escritor
+ARQUIVO_ATUAL = "ATUAL.json"
+ARQUIVO_LOCK = "escritor.lock"
+
+# Versões anteriores mantidas no diretório além da vigente
+VERSOES_MANTIDAS = 1
+
+
+# Estado do processo: lock de escritor (se obtido) e a última versão aberta
+def criar_compartilhado(diretorio=DIRETORIO_PADRAO):
+    os.makedirs(diretorio, exist_ok=True)
+    return {
+        'diretorio': diretorio,
+        'lock': open(os.path.join(diretorio, ARQUIVO_LOCK), "a+"),
+        'escritor': False,
+        'dados': (None, None),     # (agregado, versão compartilhada)
+        'versao_local': None,      # versão do carregador local publicada por último (só no escritor)
+        'assumindo': False,        # primeira carga do escritor em andamento em segundo plano
+        'trava': threading.Lock(),
+    }
+
+
+# Tenta assumir o papel de escritor; o lock é liberado pelo sistema se o processo morrer,
+# e outro processo assume na próxima tentativa
+def tentar_escritor(estado):
+    if not estado['escritor']:
+        try:
+            fcntl.flock(estado['lock'], fcntl.LOCK_EX | fcntl.LOCK_NB)
+            estado['escritor'] = True
+        except BlockingIOError:
+            pass
+    return estado['escritor']
+
+
+# Ponteiro da versão vigente ({'versao', 'arquivo'}) ou None se nada foi publicado
+def ler_ponteiro(diretorio):
+    try:
+        with open(os.path.join(diretorio, ARQUIVO_ATUAL)) as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+
+
+# Grava o agregado em um novo arquivo Arrow IPC e só então troca o ponteiro, de forma atômica.
+# Devolve a nova versão (a anterior + 1, contínua mesmo quando o escritor muda de processo).
+def publicar_compartilhado(agregado, diretorio):
+    ponteiro = ler_ponteiro(diretorio)
+    versao = (ponteiro['versao'] if ponteiro else 0) + 1
+    nome = f"agregado-{versao}-{os.getpid()}.arrow"
+
+    tabela = pa.Table.from_pandas(agregado, preserve_index=False)
+    temporario = os.path.join(diretorio, f".{nome}")
+    with pa.OSFile(temporario, "wb") as destino, pa.ipc.new_file(destino, tabela.schema) as escritor:
+        escritor.write_table(tabela)
+    os.replace(temporario, os.path.join(diretorio, nome))
+
+    temporario = os.path.join(diretorio, f".{nome}.json")
+    with open(temporario, "w") as arquivo:
+        json.dump({'versao': versao, 'arquivo': nome, 'publicado_em': time.time()}, arquivo)
+    os.replace(temporario, os.path.join(diretorio, ARQUIVO_ATUAL))
+
+    remover_versoes_antigas(diretorio, versao)
+    return versao
+
+
+# Apaga as versões substituídas; processos que ainda as têm mapeadas continuam lendo normalmente
+def remover_versoes_antigas(diretorio, vigente):
+    for nome in os.listdir(diretorio):
+        if nome.startswith("agregado-") and int(nome.split("-")[1]) < vigente - VERSOES_MANTIDAS:
+            try:
+                os.remove(os.path.join(diretorio, nome))
+            except OSError:
+                pass
+
+
+# Abre a versão do ponteiro com memory mapping; as colunas numéricas são lidas direto das páginas mapeadas
+def abrir_compartilhado(diretorio, ponteiro):
+    mapa = pa.memory_map(os.path.join(diretorio, ponteiro['arquivo']))
+    tabela = pa.ipc.open_file(mapa).read_all()
+    return tabela.to_pandas(split_blocks=True)
+
+
+# Roda a carga local do escritor fora da trava e publica o resultado se for uma versão local mais nova
+def publicar_carga(estado, carregar):
+    agregado, versao_local = carregar()
+    with estado['trava']:
+        if agregado is not None and (estado['versao_local'] is None or versao_local > estado['versao_local']):
+            estado['dados'] = (agregado, publicar_compartilhado(agregado, estado['diretorio']))
+            estado['versao_local'] = versao_local
+        return estado['dados']
+
+
+# Primeira carga de um processo que assumiu a escrita já tendo uma versão aberta: corre em segundo plano,
+# e as sessões seguem com a versão compartilhada até ela terminar
+def assumir_em_segundo_plano(estado, carregar):
+    try:
+        publicar_carga(estado, carregar)
+    except (SQLAlchemyError, OSError) as erro:
+        print(f"Falha na primeira carga do novo escritor: {erro}")
+    finally:
+        estado['assumindo'] = False
+
+
+# Devolve (agregado, versão compartilhada). No escritor, `carregar()` (a carga local do app) devolve (agregado, versão local)
+# e cada versão local nova é publicada; nos demais processos só o ponteiro é lido, e o arquivo é reaberto quando muda.
+# A trava só protege as trocas de estado: cargas do banco e aberturas de arquivo correm fora dela.
+# O agregado é None enquanto nenhum processo tiver publicado.
+def obter_compartilhado(estado, carregar):
+    with estado['trava']:
+        escritor = tentar_escritor(estado)
+        if escritor and estado['versao_local'] is None and estado['dados'][0] is not None:
+            if not estado['assumindo']:
+                estado['assumindo'] = True
+                threading.Thread(target=assumir_em_segundo_plano, args=(estado, carregar), daemon=True).start()
+            return estado['dados']
+        atual = estado['dados']
+    if escritor:
+        return publicar_carga(estado, carregar)
+
+    ponteiro = ler_ponteiro(estado['diretorio'])
+    if ponteiro is None or ponteiro['versao'] == atual[1]:
+        return atual
+    try:
+        agregado = abrir_compartilhado(estado['diretorio'], ponteiro)
+    except (OSError, pa.ArrowInvalid) as erro:
+        # O arquivo pode ter sido substituído entre a leitura do ponteiro e a abertura; tenta de novo no próximo acesso
+        print(f"Agregado compartilhado indisponível: {erro}")
+        return atual
+    with estado['trava']:
+        if estado['dados'][1] is None or ponteiro['versao'] > estado['dados'][1]:
+            estado['dados'] = (agregado, ponteiro['versao'])
+        return estado['dados']
+
+
+# Mantém o agregado em dia mesmo sem sessões abertas no escritor e, nos demais processos,
+# assume a escrita se o escritor atual cair
+def iniciar_atualizador(estado, carregar, intervalo):
+    def atualizar():
+        while True:
+            time.sleep(intervalo)
+            try:
+                obter_compartilhado(estado, carregar)
+            except (SQLAlchemyError, OSError) as erro:
+                print(f"Falha ao atualizar o agregado compartilhado: {erro}")
+
+    threading.Thread(target=atualizar, daemon=True, name="compartilhado").start()
@@ -0,0 +1,82 @@
+import os
+from io import BytesIO
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+
+# Drivers aceitos em DB_DRIVER para o Postgres
+DRIVERS = ('pg8000', 'psycopg', 'psycopg2')
+DRIVER_PADRAO = 'pg8000'
+
+# Configuração padrão do pool de conexões (sobrescrita pelas variáveis DB_POOL_* do .env)
+POOL_PADRAO = {
+    'pool_size': 5,
+    'max_overflow': 5,
+    'pool_recycle': 1800,
+    'pool_timeout': 30,
+}
+
+
+# String de conexão a partir das variáveis do .env; DB_URL (ex.: sqlite:///recebimentos.db) substitui o Postgres
+def url_do_ambiente():
+    url = os.getenv("DB_URL")
+    if url:
+        return url
+    driver = os.getenv("DB_DRIVER", DRIVER_PADRAO)
+    if driver not in DRIVERS:
+        raise ValueError(f"DB_DRIVER inválido: {driver}. Use um de {', '.join(DRIVERS)}.")
+    return (f'postgresql+{driver}://{os.getenv("DB_USER")}:{os.getenv("DB_PASSWORD")}'
+            f'@{os.getenv("DB_HOST")}:{os.getenv("DB_PORT")}/{os.getenv("DB_NAME")}')
+
+
+# Parâmetros do pool lidos do .env
+def configuracao_pool():
+    configuracao = {chave: int(os.getenv(f"DB_{chave.upper()}", valor)) for chave, valor in POOL_PADRAO.items()}
+    configuracao['pool_pre_ping'] = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "sim")
+    return configuracao
+
+
+# Cria a engine do processo, com pool configurado. Deve ser criada uma única vez e reaproveitada.
+def criar_engine(url=None):
+    url = url or url_do_ambiente()
+    configuracao = configuracao_pool()
+    # O tamanho do pool só se aplica a servidores; bancos locais (SQLite/DuckDB) usam o pool padrão do dialeto
+    if make_url(url).get_backend_name() != 'postgresql':
+        configuracao = {'pool_pre_ping': configuracao['pool_pre_ping']}
+    return create_engine(url, **configuracao)
+
+
+# Colunas de texto lidas do CSV do COPY sem inferência de tipo ("00123" continua texto) e com NULL preservado
+CONVERSAO_COPY = pa_csv.ConvertOptions(column_types={'CATEGORIA': pa.string(), 'ITEM_PCG': pa.string()},
+                                       strings_can_be_null=True)
+
+
+# Lê via COPY ... TO STDOUT (psycopg 3) direto para Arrow, sem montar tuplas Python por linha.
+# Erros do driver voltam como DBAPIError do SQLAlchemy, para valerem os mesmos tratamentos dos outros drivers.
+def ler_via_copy(connection, query, parametros=None):
+    import psycopg
+
+    sql = query.bindparams(**(parametros or {})).compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+    comando = f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+    conexao_driver = connection.connection.driver_connection
+    buffer = BytesIO()
+    try:
+        with conexao_driver.cursor() as cursor:
+            with cursor.copy(comando) as copia:
+                for bloco in copia:
+                    buffer.write(bloco)
+    except psycopg.Error as erro:
+        raise DBAPIError.instance(comando, None, erro, psycopg.Error, dialect=connection.dialect) from erro
+    buffer.seek(0)
+    return pa_csv.read_csv(buffer, convert_options=CONVERSAO_COPY).to_pandas()
+
+
+# Leitura em massa: COPY para Arrow com psycopg 3. Nos demais drivers o cursor no servidor (stream_results)
+# evita que o driver traga tudo de uma vez, mas o pandas ainda monta as linhas como tuplas Python.
+def ler_em_massa(connection, query, parametros=None):
+    if connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg':
+        return ler_via_copy(connection, query, parametros)
+    return pd.read_sql(query, connection.execution_options(stream_results=True), params=parametros)
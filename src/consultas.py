@@ -0,0 +1,190 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from conexao import ler_em_massa
+
+# Tabela padrão de recebimentos no banco 'telemedicina'
+TABELA_RECEBIMENTOS = "telemedicina.recebimentos"
+
+# Colunas do agregado mensal devolvido por todas as rotas de carga. Depois de `normalizar_agregado`:
+# PERIODO é o ordinal inteiro do mês (ano * 12 + mês - 1), CATEGORIA (já em title case) e ITEM_PCG
+# são `category`, e TOTAL_RECEBIDO é inteiro em centavos.
+COLUNAS_AGREGADO = ['PERIODO', 'CATEGORIA', 'ITEM_PCG', 'TOTAL_RECEBIDO']
+
+# Expressão que trunca "DATA" no primeiro dia do mês em cada banco suportado
+# (SQLite e DuckDB servem de substitutos locais do Postgres para testes offline)
+TRUNCAR_MES = {
+    'postgresql': "CAST(date_trunc('month', \"DATA\") AS DATE)",
+    'duckdb': "date_trunc('month', \"DATA\")",
+    'sqlite': "date(\"DATA\", 'start of month')",
+}
+
+# Mesma ideia no nível do dia, para o agregado diário usado no detalhamento
+TRUNCAR_DIA = {
+    'postgresql': "CAST(\"DATA\" AS DATE)",
+    'duckdb': "CAST(\"DATA\" AS DATE)",
+    'sqlite': "date(\"DATA\")",
+}
+
+# Granularidades do agregado: 'mes' (PERIODO = ordinal do mês) ou 'dia' (PERIODO = dias desde 1970-01-01)
+TRUNCAR = {'mes': TRUNCAR_MES, 'dia': TRUNCAR_DIA}
+
+
+# Primeiro dia do mês seguinte, usado como limite aberto dos intervalos de datas
+def proximo_mes(ano, mes):
+    return date(ano + 1, 1, 1) if mes == 12 else date(ano, mes + 1, 1)
+
+
+# Data no formato aceito pelo driver (o sqlite3 não converte objetos date, então vai como texto ISO)
+def parametro_data(dialeto, valor):
+    return valor.isoformat() if dialeto == 'sqlite' else valor
+
+
+# Tamanho padrão dos lotes de linhas brutas na ingestão em streaming
+TAMANHO_LOTE_PADRAO = 100_000
+
+
+# Cláusula WHERE (e seus parâmetros) comum às consultas agregada e em lotes.
+# Com `meses` (lista de pares (ano, mês)) o banco lê apenas esses intervalos;
+# com `desde` (date), apenas os recebimentos a partir dessa data.
+def montar_filtro(dialeto, meses=None, desde=None):
+    parametros = {}
+    filtros = []
+
+    if meses:
+        condicoes = []
+        for i, (ano, mes) in enumerate(sorted(set(meses))):
+            parametros[f"inicio_{i}"] = parametro_data(dialeto, date(ano, mes, 1))
+            parametros[f"fim_{i}"] = parametro_data(dialeto, proximo_mes(ano, mes))
+            # Intervalo direto sobre "DATA" para que o banco possa usar índices
+            condicoes.append(f"(\"DATA\" >= :inicio_{i} AND \"DATA\" < :fim_{i})")
+        filtros.append("(" + " OR ".join(condicoes) + ")")
+
+    if desde is not None:
+        parametros["desde"] = parametro_data(dialeto, desde)
+        filtros.append("\"DATA\" >= :desde")
+
+    filtro = "WHERE " + " AND ".join(filtros) if filtros else ""
+    return filtro, parametros
+
+
+# Monta a consulta que soma TOTAL_RECEBIDO por mês (ou dia), categoria e produto
+def montar_query_agregada(dialeto="postgresql", tabela=TABELA_RECEBIMENTOS, meses=None, desde=None, granularidade='mes'):
+    truncar = TRUNCAR[granularidade].get(dialeto, TRUNCAR[granularidade]['postgresql'])
+    filtro, parametros = montar_filtro(dialeto, meses, desde)
+
+    query = f"""
+        SELECT {truncar} AS "PERIODO", "CATEGORIA", "ITEM_PCG",
+               SUM("TOTAL_RECEBIDO") AS "TOTAL_RECEBIDO"
+        FROM {tabela}
+        {filtro}
+        GROUP BY 1, 2, 3
+    """
+    return text(query), parametros
+
+
+# Ordinal inteiro do mês (meses corridos desde o ano 0), chave de período de todo o pipeline
+def ordinal_mes(ano, mes):
+    return int(ano) * 12 + int(mes) - 1
+
+
+# Converte o ordinal de volta para o par (ano, mês)
+def ano_mes(ordinal):
+    ano, mes = divmod(int(ordinal), 12)
+    return ano, mes + 1
+
+
+# Ordinal inteiro do dia (dias desde 1970-01-01), chave de período do agregado diário
+def ordinal_dia(data):
+    return int(np.datetime64(data, 'D').astype(np.int64))
+
+
+# Converte uma coluna de texto para `category`, aplicando `formatar` só aos valores distintos
+def para_categoria(coluna, formatar=None):
+    if isinstance(coluna.dtype, pd.CategoricalDtype):
+        coluna = coluna.cat.remove_unused_categories()
+        codigos, valores = coluna.cat.codes.to_numpy(), pd.Index(coluna.cat.categories)
+    else:
+        codigos, valores = pd.factorize(coluna)
+    if formatar is not None:
+        valores = formatar(valores.astype(str))
+    # Rótulos que coincidem depois de formatados passam a ser uma única categoria, em ordem alfabética
+    novos_codigos, categorias = pd.factorize(valores, sort=True)
+    codigos = np.where(codigos >= 0, novos_codigos[codigos], -1)
+    return pd.Categorical.from_codes(codigos, categories=categorias)
+
+
+# Normalização feita uma única vez na carga: categorias compactas, período inteiro e valores em centavos
+def normalizar_agregado(agregado, granularidade='mes'):
+    periodo = agregado['PERIODO']
+    if pd.api.types.is_datetime64_any_dtype(periodo):
+        if granularidade == 'dia':
+            periodo = periodo.to_numpy().astype('datetime64[D]').astype(np.int64)
+        else:
+            periodo = periodo.dt.year * 12 + periodo.dt.month - 1
+    normalizado = pd.DataFrame({
+        'PERIODO': np.asarray(periodo, dtype=np.int32),
+        'CATEGORIA': para_categoria(agregado['CATEGORIA'], lambda valores: valores.str.title()),
+        'ITEM_PCG': para_categoria(agregado['ITEM_PCG']),
+        'TOTAL_RECEBIDO': np.round(agregado['TOTAL_RECEBIDO'].fillna(0).to_numpy(dtype=float) * 100).astype(np.int64),
+    })
+    return normalizado
+
+
+# Agrega linhas brutas de recebimentos em pandas, no mesmo formato do banco
+def agregar_dataframe(df, granularidade='mes'):
+    df = df.copy()
+    df['DATA'] = pd.to_datetime(df['DATA'], errors='coerce')
+    df = df.dropna(subset=['DATA'])
+    # Chaves como `category` deixam o groupby sobre as linhas brutas bem mais leve
+    df['CATEGORIA'] = para_categoria(df['CATEGORIA'])
+    df['ITEM_PCG'] = para_categoria(df['ITEM_PCG'])
+    df['PERIODO'] = df['DATA'].dt.floor('D') if granularidade == 'dia' else df['DATA'].dt.to_period('M').dt.to_timestamp()
+    agregado = df.groupby(['PERIODO', 'CATEGORIA', 'ITEM_PCG'], as_index=False, observed=True)['TOTAL_RECEBIDO'].sum()
+    return agregado[COLUNAS_AGREGADO]
+
+
+# Ingestão em streaming: lê as linhas brutas em lotes por um cursor no servidor e incorpora cada lote
+# ao agregado mensal. A memória fica proporcional ao lote mais o número de chaves (mês, categoria, produto),
+# e não ao total de linhas da tabela.
+def agregar_em_lotes(connection, tabela=TABELA_RECEBIMENTOS, meses=None, desde=None, tamanho_lote=TAMANHO_LOTE_PADRAO,
+                     granularidade='mes'):
+    filtro, parametros = montar_filtro(connection.dialect.name, meses, desde)
+    query = text(f'SELECT "DATA", "CATEGORIA", "ITEM_PCG", "TOTAL_RECEBIDO" FROM {tabela} {filtro}')
+    streaming = connection.execution_options(stream_results=True, max_row_buffer=tamanho_lote)
+
+    agregado = pd.DataFrame(columns=COLUNAS_AGREGADO)
+    for lote in pd.read_sql(query, streaming, params=parametros, chunksize=tamanho_lote):
+        parcial = agregar_dataframe(lote, granularidade)
+        if agregado.empty:
+            agregado = parcial
+            continue
+        # Categorias diferentes entre lotes viram texto no concat; o groupby volta a colapsar as chaves
+        agregado = pd.concat([agregado, parcial], ignore_index=True)
+        agregado = agregado.groupby(['PERIODO', 'CATEGORIA', 'ITEM_PCG'], as_index=False, observed=True)['TOTAL_RECEBIDO'].sum()
+    return agregado[COLUNAS_AGREGADO]
+
+
+# Lê o agregado já calculado pelo banco
+def ler_agregado(connection, tabela=TABELA_RECEBIMENTOS, meses=None, desde=None, granularidade='mes'):
+    query, parametros = montar_query_agregada(connection.dialect.name, tabela, meses, desde, granularidade)
+    agregado = ler_em_massa(connection, query, parametros)
+    agregado['PERIODO'] = pd.to_datetime(agregado['PERIODO'])
+    return agregado[COLUNAS_AGREGADO]
+
+
+# Carrega o agregado mensal (ou diário, com granularidade='dia') já normalizado, empurrando o GROUP BY
+# para o banco. Se o banco não suportar a consulta (ou `no_banco=False`), lê as linhas brutas em lotes
+# de `tamanho_lote` e agrega em pandas.
+def carregar_agregado(connection, tabela=TABELA_RECEBIMENTOS, meses=None, desde=None, no_banco=True,
+                      tamanho_lote=TAMANHO_LOTE_PADRAO, granularidade='mes'):
+    if no_banco:
+        try:
+            return normalizar_agregado(ler_agregado(connection, tabela, meses, desde, granularidade), granularidade)
+        except SQLAlchemyError as erro:
+            print(f"Agregação no banco indisponível, usando pandas: {erro}")
+            connection.rollback()
+
+    return normalizar_agregado(agregar_em_lotes(connection, tabela, meses, desde, tamanho_lote, granularidade), granularidade)
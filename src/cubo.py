@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+from consultas import ano_mes, ordinal_mes
+from variacao import variacao_percentual
+
+# Quantidade padrão de grupos destacados nos gráficos e rótulo do grupo com o restante
+N_PADRAO = 20
+ROTULO_OUTROS = "Outros"
+
+
+# Constrói o cubo (período, CATEGORIA, ITEM_PCG) -> TOTAL_RECEBIDO a partir do agregado normalizado.
+# Os códigos das colunas `category` viram direto os índices do cubo; os valores voltam de centavos para reais.
+# Os totais por período, por categoria e por produto ficam pré-calculados para leituras O(1).
+def construir_cubo(agregado):
+    codigos_periodo, periodos = pd.factorize(agregado['PERIODO'].to_numpy(), sort=True)
+    categorias = agregado['CATEGORIA'].cat.categories
+    produtos = agregado['ITEM_PCG'].cat.categories
+
+    codigos_categoria = agregado['CATEGORIA'].cat.codes.to_numpy()
+    codigos_produto = agregado['ITEM_PCG'].cat.codes.to_numpy()
+    validos = (codigos_categoria >= 0) & (codigos_produto >= 0)  # linhas sem categoria ou produto ficam de fora
+
+    valores = np.zeros((len(periodos), len(categorias), len(produtos)))
+    np.add.at(valores, (codigos_periodo[validos], codigos_categoria[validos], codigos_produto[validos]),
+              agregado['TOTAL_RECEBIDO'].to_numpy()[validos] / 100)
+
+    return {
+        'valores': valores,
+        'periodos': {int(ordinal): i for i, ordinal in enumerate(periodos)},
+        'categorias': pd.Index(categorias, name='CATEGORIA'),
+        'produtos': pd.Index(produtos, name='ITEM_PCG'),
+        'total_categoria': valores.sum(axis=2),   # (período, categoria)
+        'total_produto': valores.sum(axis=1),     # (período, produto)
+    }
+
+
+# Anos disponíveis no cubo, para os seletores da sidebar
+def anos_disponiveis(cubo):
+    return sorted({ano_mes(ordinal)[0] for ordinal in cubo['periodos']})
+
+
+# Posição do período no cubo, ou None se não houver recebimentos no mês
+def indice_periodo(cubo, ano, mes):
+    return cubo['periodos'].get(ordinal_mes(ano, mes))
+
+
+# Posição da categoria no cubo ("Todos" ou categoria desconhecida retornam None)
+def indice_categoria(cubo, categoria):
+    if categoria is None or categoria not in cubo['categorias']:
+        return None
+    return cubo['categorias'].get_loc(categoria)
+
+
+# Recebimento por categoria em um mês (zeros se o mês não existir)
+def recebimento_por_categoria(cubo, ano, mes):
+    i = indice_periodo(cubo, ano, mes)
+    valores = cubo['total_categoria'][i] if i is not None else np.zeros(len(cubo['categorias']))
+    return pd.Series(valores, index=cubo['categorias'])
+
+
+# Recebimento por produto em um mês, opcionalmente restrito a uma categoria
+def recebimento_por_produto(cubo, ano, mes, categoria=None):
+    i = indice_periodo(cubo, ano, mes)
+    c = indice_categoria(cubo, categoria)
+    if i is None:
+        valores = np.zeros(len(cubo['produtos']))
+    elif c is None:
+        valores = cubo['total_produto'][i]
+    else:
+        valores = cubo['valores'][i, c]
+    return pd.Series(valores, index=cubo['produtos'])
+
+
+# Recebimento total do mês, opcionalmente restrito a uma categoria
+def total_periodo(cubo, ano, mes, categoria=None):
+    i = indice_periodo(cubo, ano, mes)
+    if i is None:
+        return 0.0
+    c = indice_categoria(cubo, categoria)
+    linha = cubo['total_categoria'][i]
+    return float(linha.sum() if c is None else linha[c])
+
+
+# Variação percentual entre dois recortes do cubo (Series alinhadas pelo mesmo índice).
+# Só entram grupos com recebimento em algum dos dois meses; sem base de comparação a variação fica NaN.
+def variacao(atual, anterior):
+    dados = pd.DataFrame({'ATUAL': atual, 'ANTERIOR': anterior})
+    dados = dados[(dados['ATUAL'] != 0) | (dados['ANTERIOR'] != 0)]
+    dados['VARIACAO_PERCENTUAL'] = variacao_percentual(dados['ATUAL'], dados['ANTERIOR'])
+    return dados.reset_index()
+
+
+# Seleciona os `n` grupos de maior variação (em valor absoluto, só as altas ou só as quedas) com seleção parcial
+# (argpartition) e soma o restante em uma única barra "Outros", recalculando a sua variação.
+# Grupos sem base de comparação ficam no fim da ordenação e, se não couberem, entram em "Outros".
+def extremos(dados, coluna, n=N_PADRAO, modo='absoluta'):
+    if n <= 0 or len(dados) <= n:
+        return dados
+    variacoes = dados['VARIACAO_PERCENTUAL'].to_numpy()
+    ordem = {'absoluta': np.abs(variacoes), 'altas': variacoes, 'quedas': -variacoes}[modo]
+    ordem = np.where(np.isnan(ordem), -np.inf, ordem)
+
+    escolhidos = np.argpartition(-ordem, n - 1)[:n]
+    restantes = np.ones(len(dados), dtype=bool)
+    restantes[escolhidos] = False
+    atual = dados['ATUAL'].to_numpy()[restantes].sum()
+    anterior = dados['ANTERIOR'].to_numpy()[restantes].sum()
+    outros = pd.DataFrame({
+        coluna: [f"{ROTULO_OUTROS} ({restantes.sum()})"],
+        'ATUAL': [atual],
+        'ANTERIOR': [anterior],
+        'VARIACAO_PERCENTUAL': [float(variacao_percentual(atual, anterior))],
+    })
+    # "Outros" primeiro: no gráfico de barras horizontais ele fica na base, abaixo dos destaques
+    destaques = dados.iloc[escolhidos].sort_values('VARIACAO_PERCENTUAL', na_position='first')
+    return pd.concat([outros, destaques], ignore_index=True)
+
+
+# Linha do tempo contínua do cubo (meses sem recebimento viram zeros), para comparar períodos por deslocamento.
+# Devolve os ordinais de todos os meses entre o primeiro e o último e o array (mês, categoria, produto).
+def densificar(cubo):
+    ordinais = np.array(sorted(cubo['periodos']), dtype=np.int64)
+    if len(ordinais) == 0:
+        return ordinais, cubo['valores']
+    linha_do_tempo = np.arange(ordinais[0], ordinais[-1] + 1)
+    posicoes = [cubo['periodos'][ordinal] for ordinal in ordinais]
+    valores = np.zeros((len(linha_do_tempo),) + cubo['valores'].shape[1:])
+    valores[ordinais - ordinais[0]] = cubo['valores'][posicoes]
+    return linha_do_tempo, valores
+
+
+# Painel (mês × grupo) em reais lido da linha do tempo do cubo, no formato de `variacao.pivotar`.
+# `dimensao` é 'CATEGORIA', 'ITEM_PCG' ou None (total); `categoria` restringe a uma categoria.
+def painel_do_cubo(cubo, dimensao=None, categoria=None):
+    linha_do_tempo, valores = densificar(cubo)
+    c = indice_categoria(cubo, categoria)
+    if c is not None:
+        valores = valores[:, c:c + 1]
+    indice = pd.RangeIndex(linha_do_tempo[0], linha_do_tempo[-1] + 1, name='PERIODO') if len(linha_do_tempo) else pd.RangeIndex(0, name='PERIODO')
+
+    if dimensao == 'CATEGORIA':
+        rotulos = cubo['categorias'] if c is None else cubo['categorias'][c:c + 1]
+        return pd.DataFrame(valores.sum(axis=2), index=indice, columns=rotulos)
+    if dimensao == 'ITEM_PCG':
+        return pd.DataFrame(valores.sum(axis=1), index=indice, columns=cubo['produtos'])
+    return pd.DataFrame({'TOTAL': valores.sum(axis=(1, 2))}, index=indice)
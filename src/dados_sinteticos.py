@@ -0,0 +1,106 @@
+import argparse
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Gera dados sintéticos no formato de telemedicina.recebimentos para benchmarks e testes offline,
+# gravados em SQLite (substituto local do Postgres) ou Parquet.
+#
+# Exemplo:
+#   python dados_sinteticos.py --linhas 1m --destino ../cache/recebimentos_1m.db
+
+# Tamanhos pré-definidos
+TAMANHOS = {'10k': 10_000, '1m': 1_000_000, '50m': 50_000_000}
+
+# Cardinalidades próximas às da base real
+CATEGORIAS = ["consulta", "exame", "plano mensal", "plano anual", "teleterapia", "segunda opinião", "check-up", "pacote empresa"]
+PRODUTOS_POR_CATEGORIA = 40
+CLIENTES = 20_000
+MESES = 36
+LOTE = 500_000
+
+
+def linhas_do_tamanho(tamanho):
+    return TAMANHOS.get(str(tamanho).lower()) or int(tamanho)
+
+
+# Catálogo fixo: cada produto pertence a uma categoria e tem um preço base
+def montar_catalogo(rng):
+    categorias = np.repeat(np.arange(len(CATEGORIAS)), PRODUTOS_POR_CATEGORIA)
+    nomes = np.array([f"{CATEGORIAS[c].upper()} {i % PRODUTOS_POR_CATEGORIA + 1:03d}" for i, c in enumerate(categorias)])
+    precos = rng.lognormal(mean=4.5, sigma=0.8, size=len(categorias)).round(2)
+    # Popularidade com cauda longa (Zipf): poucos produtos concentram a maior parte das vendas
+    popularidade = 1 / np.arange(1, len(categorias) + 1) ** 1.1
+    rng.shuffle(popularidade)
+    return categorias, nomes, precos, popularidade / popularidade.sum()
+
+
+# Gera `linhas` recebimentos em lotes de DataFrame, terminando no mês anterior a `fim`
+def gerar_lotes(linhas, semente=42, fim=None, meses=MESES, lote=LOTE):
+    rng = np.random.default_rng(semente)
+    categorias, nomes, precos, popularidade = montar_catalogo(rng)
+    fim = pd.Timestamp(fim or pd.Timestamp.today()).to_period('M').to_timestamp()
+    inicio = fim - pd.DateOffset(months=meses)
+    dias = (fim - inicio).days
+
+    for deslocamento in range(0, linhas, lote):
+        n = min(lote, linhas - deslocamento)
+        produto = rng.choice(len(nomes), size=n, p=popularidade)
+        yield pd.DataFrame({
+            'DATA': (inicio + pd.to_timedelta(np.sort(rng.integers(0, dias, size=n)), unit='D')).date,
+            'CATEGORIA': np.array(CATEGORIAS)[categorias[produto]],
+            'CLIENTE': np.char.add("CLIENTE ", rng.integers(1, CLIENTES, size=n).astype(str)),
+            'ITEM_PCG': nomes[produto],
+            'TOTAL_RECEBIDO': (precos[produto] * rng.uniform(0.8, 1.2, size=n)).round(2),
+            'STATUS': rng.choice(["PAGO", "PAGO", "PAGO", "ESTORNO"], size=n),
+        })
+
+
+# Grava em SQLite na tabela `recebimentos` (usar com DB_URL=sqlite:///<arquivo> e DB_TABELA=recebimentos)
+def gravar_sqlite(lotes, caminho):
+    if os.path.exists(caminho):
+        os.remove(caminho)
+    with sqlite3.connect(caminho) as conexao:
+        for lote in lotes:
+            lote.assign(DATA=lote['DATA'].astype(str)).to_sql("recebimentos", conexao, if_exists="append", index=False)
+        conexao.execute('CREATE INDEX idx_recebimentos_data ON recebimentos ("DATA")')
+
+
+# Grava em um único arquivo Parquet, lote a lote
+def gravar_parquet(lotes, caminho):
+    escritor = None
+    try:
+        for lote in lotes:
+            tabela = pa.Table.from_pandas(lote, preserve_index=False)
+            if escritor is None:
+                escritor = pq.ParquetWriter(caminho, tabela.schema)
+            escritor.write_table(tabela)
+    finally:
+        if escritor is not None:
+            escritor.close()
+
+
+def gerar_arquivo(tamanho, destino, semente=42, fim=None):
+    lotes = gerar_lotes(linhas_do_tamanho(tamanho), semente, fim)
+    if destino.endswith(".parquet"):
+        gravar_parquet(lotes, destino)
+    else:
+        gravar_sqlite(lotes, destino)
+    return destino
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera recebimentos sintéticos em SQLite (.db) ou Parquet (.parquet).")
+    parser.add_argument("--linhas", default="10k", help="10k, 1m, 50m ou um número de linhas")
+    parser.add_argument("--destino", required=True, help="Arquivo de saída (.db ou .parquet)")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--fim", help="Mês final (AAAA-MM); padrão: mês atual")
+    args = parser.parse_args()
+    print(gerar_arquivo(args.linhas, args.destino, args.semente, args.fim))
+
+
+if __name__ == "__main__":
+    main()
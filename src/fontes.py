@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import pandas as pd
+from consultas import TABELA_RECEBIMENTOS, para_categoria
+from sincronizacao import INTERVALO_PADRAO, criar_sincronizacao, sincronizar
+
+# Carga de várias fontes (um schema/tabela de recebimentos por rede de clínicas) em paralelo.
+# Cada fonte tem a sua própria sincronização (e snapshot); as cargas correm num pool de threads com prazo por fonte,
+# e o agregado publicado junta as fontes já prontas com a dimensão FONTE. Fontes lentas entram quando terminarem.
+
+# Prazo padrão (segundos) de cada fonte antes de o dashboard seguir sem ela
+TIMEOUT_PADRAO = 30
+THREADS_PADRAO = 8
+
+
+# Lê a lista de fontes no formato "nome=schema.tabela[:timeout], ..." (ex.: DB_FONTES do .env)
+def ler_fontes(texto, timeout=TIMEOUT_PADRAO):
+    fontes = []
+    for item in filter(None, (parte.strip() for parte in texto.split(","))):
+        nome, _, resto = item.partition("=")
+        tabela, _, limite = resto.partition(":")
+        fontes.append({
+            'nome': nome.strip(),
+            'tabela': tabela.strip() or TABELA_RECEBIMENTOS,
+            'timeout': float(limite) if limite.strip() else timeout,
+        })
+    return fontes
+
+
+# Cria o estado das fontes e dispara a carga inicial de todas ao mesmo tempo.
+# Os demais parâmetros são repassados a `criar_sincronizacao` de cada fonte; o snapshot de cada uma
+# fica em um subdiretório com o nome da fonte.
+def criar_fontes(engine, fontes, intervalo=INTERVALO_PADRAO, coluna_atualizacao=None, diretorio_snapshot=None,
+                 opcoes_carga=None, threads=THREADS_PADRAO):
+    estado = {
+        'engine': engine,
+        'fontes': {fonte['nome']: fonte for fonte in fontes},
+        'intervalo': intervalo,
+        'coluna_atualizacao': coluna_atualizacao,
+        'diretorio_snapshot': diretorio_snapshot,
+        'opcoes_carga': opcoes_carga or {},
+        'executor': ThreadPoolExecutor(max_workers=max(1, min(threads, len(fontes))), thread_name_prefix="fonte"),
+        'pendentes': {},        # nome -> (futuro da carga inicial, início)
+        'sincronizacoes': {},   # nome -> estado de `sincronizacao` da fonte já carregada
+        'erros': {},            # nome -> (mensagem, instante)
+        'dados': (None, 0),     # (agregado com FONTE, versão)
+        'versoes': None,        # versões das fontes que compõem o agregado publicado
+        'trava': threading.Lock(),
+    }
+    for nome in estado['fontes']:
+        iniciar_fonte(estado, nome)
+    return estado
+
+
+def iniciar_fonte(estado, nome):
+    fonte = estado['fontes'][nome]
+    diretorio = os.path.join(estado['diretorio_snapshot'], nome) if estado['diretorio_snapshot'] else None
+    futuro = estado['executor'].submit(criar_sincronizacao, estado['engine'], fonte['tabela'], estado['intervalo'],
+                                       estado['coluna_atualizacao'], diretorio, estado['opcoes_carga'])
+    estado['pendentes'][nome] = (futuro, time.monotonic())
+    estado['erros'].pop(nome, None)
+
+
+# Espera cada carga inicial só até o prazo da sua fonte; as que estouram seguem em segundo plano.
+# A espera é feita fora da trava, para que uma fonte lenta não segure as outras sessões; a trava só protege
+# as trocas de estado. Qualquer falha da carga (banco, snapshot, configuração) vira erro da fonte.
+def receber_cargas(estado):
+    with estado['trava']:
+        # Fontes que falharam são tentadas de novo a cada intervalo de sincronização
+        for nome, (_, instante) in list(estado['erros'].items()):
+            if estado['intervalo'] and time.monotonic() - instante >= estado['intervalo']:
+                iniciar_fonte(estado, nome)
+        pendentes = list(estado['pendentes'].items())
+
+    for nome, (futuro, inicio) in pendentes:
+        restante = inicio + estado['fontes'][nome]['timeout'] - time.monotonic()
+        if not wait([futuro], timeout=max(restante, 0)).done:
+            continue
+        erro = futuro.exception()
+        with estado['trava']:
+            # Outra sessão pode já ter registrado o resultado desta carga
+            if nome not in estado['pendentes'] or estado['pendentes'][nome][0] is not futuro:
+                continue
+            del estado['pendentes'][nome]
+            if erro is None:
+                estado['sincronizacoes'][nome] = futuro.result()
+            else:
+                print(f"Falha ao carregar a fonte {nome}: {erro!r}")
+                estado['erros'][nome] = (str(erro) or type(erro).__name__, time.monotonic())
+
+
+# Dados atuais das fontes já carregadas. `sincronizar` dispara em segundo plano a sincronização de cada fonte
+# cujo intervalo venceu, então as fontes sincronizam em paralelo e nenhuma sessão espera por elas.
+def sincronizar_fontes(estado):
+    with estado['trava']:
+        sincronizacoes = dict(estado['sincronizacoes'])
+    return {nome: sincronizar(sincronizacao) for nome, sincronizacao in sincronizacoes.items()}
+
+
+# Junta os agregados das fontes com a coluna FONTE, reconstruindo as categorias da união
+def mesclar_fontes(dados_fontes):
+    partes = [agregado.assign(FONTE=nome) for nome, (agregado, _) in sorted(dados_fontes.items()) if agregado is not None]
+    if not partes:
+        return None
+    mesclado = pd.concat(partes, ignore_index=True)
+    for coluna in ('CATEGORIA', 'ITEM_PCG', 'FONTE'):
+        mesclado[coluna] = para_categoria(mesclado[coluna])
+    return mesclado
+
+
+# Devolve (agregado, versão) com as fontes prontas até aqui; o agregado é None enquanto nenhuma fonte terminou.
+# A versão muda quando uma fonte entra ou publica dados novos.
+def coletar(estado):
+    receber_cargas(estado)
+    dados_fontes = sincronizar_fontes(estado)
+    versoes = tuple(sorted((nome, versao) for nome, (_, versao) in dados_fontes.items()))
+    if versoes == estado['versoes']:
+        return estado['dados']
+
+    mesclado = mesclar_fontes(dados_fontes)
+    with estado['trava']:
+        # Só publica se nenhuma outra sessão já tiver publicado esta combinação ou uma mais nova
+        publicadas = dict(estado['versoes'] or ())
+        if versoes != estado['versoes'] and all(versao >= publicadas.get(nome, 0) for nome, versao in versoes):
+            _, versao = estado['dados']
+            estado['dados'] = (mesclado, versao + 1)
+            estado['versoes'] = versoes
+        return estado['dados']
+
+
+# Situação de cada fonte para exibição: "ok", "carregando" ou a mensagem de erro
+def situacao_fontes(estado):
+    situacao = {}
+    for nome in estado['fontes']:
+        if nome in estado['sincronizacoes']:
+            situacao[nome] = "ok"
+        elif nome in estado['erros']:
+            situacao[nome] = estado['erros'][nome][0]
+        else:
+            situacao[nome] = "carregando"
+    return situacao
+
+
+# Tabelas das fontes já carregadas (todas ou só `nome`), para leituras complementares como o detalhamento diário
+def tabelas_fontes(estado, nome=None):
+    return tuple(estado['fontes'][fonte]['tabela'] for fonte in sorted(estado['sincronizacoes']) if nome in (None, fonte))
@@ -0,0 +1,96 @@
+import threading
+from collections import OrderedDict
+from io import BytesIO
+import matplotlib
+from matplotlib.figure import Figure
+from variacao import formatar_variacao
+
+# Configuração de cores para os gráficos
+cores_graficos = matplotlib.colormaps['Pastel1'].colors
+COR_NEGATIVA = cores_graficos[0]
+COR_POSITIVA = cores_graficos[2]
+
+# Limites padrão do cache de gráficos renderizados
+LIMITE_BYTES_PADRAO = 64 * 1024 * 1024
+LIMITE_ITENS_PADRAO = 256
+
+
+# Cor de cada barra conforme o sinal da variação
+def cores_variacao(variacoes):
+    return [COR_NEGATIVA if var < 0 else COR_POSITIVA for var in variacoes]
+
+
+# Rasteriza a figura em PNG. As figuras são criadas com `Figure` (sem pyplot), então não há estado global
+# a fechar e várias sessões podem renderizar ao mesmo tempo.
+def figura_para_png(fig):
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png", dpi=200, bbox_inches="tight")
+    return buffer.getvalue()
+
+
+# Gráfico 1: Variação Percentual por Categoria
+def renderizar_grafico_categoria(dados_porcentagem_categoria):
+    # Grupos sem base de comparação aparecem com barra zerada e rótulo "s/ base", em vez de inf/NaN
+    variacoes = dados_porcentagem_categoria['VARIACAO_PERCENTUAL']
+    fig_categoria = Figure(figsize=(12, 7))
+    ax_categoria = fig_categoria.subplots()
+    barras_categoria = ax_categoria.bar(dados_porcentagem_categoria['CATEGORIA'], variacoes.fillna(0), color=cores_variacao(variacoes))
+
+    ax_categoria.bar_label(barras_categoria, labels=[formatar_variacao(var) for var in variacoes], padding=3)
+    ax_categoria.set_frame_on(False)
+    ax_categoria.tick_params(axis='x', rotation=45, labelsize=10, pad=20, length=0)
+    ax_categoria.set_yticks([])
+
+    return figura_para_png(fig_categoria)
+
+
+# Gráfico 2: Variação Percentual por Produto
+def renderizar_grafico_produto(dados_porcentagem_produto):
+    variacoes = dados_porcentagem_produto['VARIACAO_PERCENTUAL']
+    fig_produto = Figure(figsize=(12, 7))
+    ax_produto = fig_produto.subplots()
+    barras_produto = ax_produto.barh(dados_porcentagem_produto['ITEM_PCG'], variacoes.fillna(0), color=cores_variacao(variacoes))
+
+    ax_produto.bar_label(barras_produto, labels=[formatar_variacao(var) for var in variacoes], padding=3)
+    ax_produto.set_frame_on(False)
+    ax_produto.tick_params(axis='y', labelsize=10, pad=30, length=0)
+    ax_produto.set_xticks([])
+
+    return figura_para_png(fig_produto)
+
+
+# Cache LRU de imagens já renderizadas, limitado em número de itens e em bytes
+def criar_cache_graficos(limite_bytes=LIMITE_BYTES_PADRAO, limite_itens=LIMITE_ITENS_PADRAO):
+    return {
+        'itens': OrderedDict(),
+        'bytes': 0,
+        'limite_bytes': limite_bytes,
+        'limite_itens': limite_itens,
+        'trava': threading.Lock(),
+    }
+
+
+# Devolve a imagem da chave, renderizando (fora da trava) só se ela não estiver no cache.
+# `medida` (opcional, de `instrumentacao.medir_etapa`) recebe se houve acerto ou falha de cache.
+def obter_grafico(cache, chave, renderizar, *args, medida=None):
+    with cache['trava']:
+        imagem = cache['itens'].get(chave)
+        if imagem is not None:
+            cache['itens'].move_to_end(chave)
+            if medida is not None:
+                medida['cache'] = "acerto"
+            return imagem
+
+    if medida is not None:
+        medida['cache'] = "falha"
+    imagem = renderizar(*args)
+
+    with cache['trava']:
+        if chave not in cache['itens']:
+            cache['itens'][chave] = imagem
+            cache['bytes'] += len(imagem)
+        # Descarta os menos usados até voltar aos limites
+        while cache['itens'] and (len(cache['itens']) > cache['limite_itens'] or cache['bytes'] > cache['limite_bytes']):
+            _, descartada = cache['itens'].popitem(last=False)
+            cache['bytes'] -= len(descartada)
+    return imagem
@@ -0,0 +1,180 @@
+import threading
+import time
+import numpy as np
+import pandas as pd
+from consultas import ano_mes, ordinal_dia, para_categoria, proximo_mes
+
+
+# Intervalo (segundos) entre recargas completas do agregado diário, que pegam o que as releituras parciais não veem
+RECARGA_COMPLETA_PADRAO = 6 * 3600
+
+
+# Índice hierárquico CATEGORIA -> ITEM_PCG -> dia sobre o agregado diário normalizado
+# (carregar_agregado(..., granularidade='dia')).
+# As linhas ficam ordenadas por (categoria, produto, dia), então cada categoria e cada produto ocupam uma faixa
+# contígua; as faixas são achadas por busca binária e as somas saem da soma acumulada (em centavos, inteira,
+# sem erro de arredondamento), sem varrer as linhas.
+def construir_indice(diario):
+    categorias = diario['CATEGORIA'].cat.categories
+    produtos = diario['ITEM_PCG'].cat.categories
+    codigos_categoria = diario['CATEGORIA'].cat.codes.to_numpy().astype(np.int64)
+    codigos_produto = diario['ITEM_PCG'].cat.codes.to_numpy().astype(np.int64)
+    dias = diario['PERIODO'].to_numpy().astype(np.int64)
+    validos = (codigos_categoria >= 0) & (codigos_produto >= 0)  # linhas sem categoria ou produto ficam de fora
+    codigos_categoria, codigos_produto, dias = codigos_categoria[validos], codigos_produto[validos], dias[validos]
+    valores = diario['TOTAL_RECEBIDO'].to_numpy()[validos].astype(np.int64)
+
+    primeiro_dia = int(dias.min()) if len(dias) else 0
+    extensao = int(dias.max()) - primeiro_dia + 1 if len(dias) else 1
+
+    # Chave composta: (categoria, produto) na parte alta e o dia na parte baixa; ordenar por ela ordena a hierarquia
+    grupos = codigos_categoria * len(produtos) + codigos_produto
+    chaves = grupos * extensao + (dias - primeiro_dia)
+    ordem = np.argsort(chaves, kind='stable')
+    chaves, grupos, valores = chaves[ordem], grupos[ordem], valores[ordem]
+
+    # Início de cada (categoria, produto) presente, para listar os produtos de uma categoria sem percorrer os dias
+    inicio_grupos = np.flatnonzero(np.r_[True, grupos[1:] != grupos[:-1]]) if len(grupos) else np.array([], dtype=np.int64)
+
+    return {
+        'categorias': pd.Index(categorias, name='CATEGORIA'),
+        'produtos': pd.Index(produtos, name='ITEM_PCG'),
+        'primeiro_dia': primeiro_dia,
+        'extensao': extensao,
+        'chaves': chaves,
+        'grupos': grupos[inicio_grupos],
+        'acumulado': np.r_[np.int64(0), np.cumsum(valores)],
+    }
+
+
+# Faixa [início, fim) de dias do mês, como ordinais de dia
+def dias_do_mes(ano, mes):
+    return ordinal_dia(f"{ano}-{mes:02d}-01"), ordinal_dia(proximo_mes(ano, mes))
+
+
+# Chave do (grupo, dia) limitada à linha do tempo do índice, para as buscas binárias
+def chave(indice, grupos, dia):
+    deslocamento = np.clip(dia - indice['primeiro_dia'], 0, indice['extensao'])
+    return grupos * indice['extensao'] + deslocamento
+
+
+# Recebimento por produto de uma categoria entre os dias [inicio, fim), só com os produtos vendidos na categoria
+def produtos_da_categoria(indice, categoria, inicio, fim):
+    if categoria not in indice['categorias']:
+        return pd.Series(dtype=float, index=pd.Index([], name='ITEM_PCG'))
+    n_produtos = len(indice['produtos'])
+    c = indice['categorias'].get_loc(categoria)
+    primeiro, ultimo = np.searchsorted(indice['grupos'], [c * n_produtos, (c + 1) * n_produtos])
+    grupos = indice['grupos'][primeiro:ultimo]
+    de = np.searchsorted(indice['chaves'], chave(indice, grupos, inicio))
+    ate = np.searchsorted(indice['chaves'], chave(indice, grupos, fim))
+    valores = (indice['acumulado'][ate] - indice['acumulado'][de]) / 100
+    return pd.Series(valores, index=indice['produtos'][grupos - c * n_produtos])
+
+
+# Série diária (dias sem recebimento viram zero) de um produto dentro de uma categoria entre os dias [inicio, fim)
+def serie_diaria(indice, categoria, produto, inicio, fim):
+    datas = pd.date_range(pd.Timestamp(inicio, unit='D'), periods=max(fim - inicio, 0), freq='D', name='DATA')
+    serie = pd.Series(0.0, index=datas)
+    if categoria not in indice['categorias'] or produto not in indice['produtos']:
+        return serie
+    grupo = indice['categorias'].get_loc(categoria) * len(indice['produtos']) + indice['produtos'].get_loc(produto)
+    de, ate = np.searchsorted(indice['chaves'], chave(indice, np.array([grupo, grupo]), np.array([inicio, fim])))
+    if ate > de:
+        dias = indice['chaves'][de:ate] % indice['extensao'] + indice['primeiro_dia'] - inicio
+        serie.iloc[dias] = np.diff(indice['acumulado'][de:ate + 1]) / 100
+    return serie
+
+
+# Junta os agregados diários de várias tabelas (fontes), somando os dias repetidos
+def combinar_diarios(partes):
+    if len(partes) == 1:
+        return partes[0]
+    diario = pd.concat(partes, ignore_index=True)
+    for coluna in ('CATEGORIA', 'ITEM_PCG'):
+        diario[coluna] = para_categoria(diario[coluna])
+    return diario.groupby(['PERIODO', 'CATEGORIA', 'ITEM_PCG'], observed=True, as_index=False)['TOTAL_RECEBIDO'].sum()
+
+
+# Ordinal do mês (ano*12 + mês - 1) de cada ordinal de dia
+def mes_do_dia(dias):
+    return np.asarray(dias).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64) + 1970 * 12
+
+
+# Assinatura de cada mês do agregado mensal (soma dos hashes das linhas), para achar os meses que mudaram
+# entre duas versões sem guardar a versão anterior inteira. Sozinha ela não vê um recebimento que só mudou de dia
+# dentro do mês; por isso `obter_indice` também relê os meses que a sincronização relê.
+def assinatura_meses(agregado):
+    colunas = ['PERIODO', 'CATEGORIA', 'ITEM_PCG', 'TOTAL_RECEBIDO']
+    hashes = pd.util.hash_pandas_object(agregado[colunas], index=False)
+    return hashes.groupby(agregado['PERIODO'].to_numpy()).sum()
+
+
+# Meses (ano, mês) novos, removidos ou alterados entre duas assinaturas
+def meses_alterados(anterior, atual):
+    anterior, atual = anterior.align(atual)
+    return [ano_mes(ordinal) for ordinal in anterior.index[anterior.ne(atual)]]
+
+
+# Troca no agregado diário os dias dos meses em `meses` pelas linhas recém-lidas
+def substituir_meses(diario, novo, meses):
+    ordinais = [ano * 12 + mes - 1 for ano, mes in meses]
+    mantidos = diario[~np.isin(mes_do_dia(diario['PERIODO'].to_numpy()), ordinais)]
+    return combinar_diarios([mantidos, novo])
+
+
+# Meses (ano, mês) do último mês já carregado no agregado diário até o último mês do agregado mensal:
+# a mesma marca d'água em "DATA" da sincronização, que sempre relê o último mês (que pode estar incompleto)
+def meses_desde_ultimo(diario, assinatura):
+    if diario.empty or assinatura.empty:
+        return []
+    inicio = int(mes_do_dia(diario['PERIODO'].to_numpy()).max())
+    return [ano_mes(ordinal) for ordinal in range(inicio, max(inicio, int(assinatura.index.max())) + 1)]
+
+
+# Estado do detalhamento de um conjunto de tabelas: agregado diário, assinatura dos meses, marca de atualização
+# e índice da versão atual
+def criar_detalhamento(recarga_completa=RECARGA_COMPLETA_PADRAO):
+    return {'diario': None, 'assinatura': None, 'marca': None, 'indice': None, 'versao': None,
+            'ultima_carga_completa': 0.0, 'recarga_completa': recarga_completa, 'trava': threading.Lock()}
+
+
+# Índice da versão `versao` do agregado mensal. `carregar(meses)` lê o agregado diário (tudo com None).
+# A cada nova versão são relidos, como na sincronização, os meses alterados desde a marca de atualização
+# (`alterados(marca)` devolve (meses, nova marca), ou meses None quando é preciso reler tudo) ou, sem coluna
+# de atualização, o último mês carregado e os seguintes; somam-se os meses cujo agregado mensal mudou.
+# De `recarga_completa` em `recarga_completa` segundos o agregado diário é relido por inteiro.
+# Enquanto uma sessão atualiza, as demais seguem com o índice da versão anterior.
+def obter_indice(detalhamento, agregado, versao, carregar, alterados=None):
+    if versao == detalhamento['versao']:
+        return detalhamento['indice']
+    if not detalhamento['trava'].acquire(blocking=detalhamento['indice'] is None):
+        return detalhamento['indice']
+    try:
+        if versao != detalhamento['versao']:
+            assinatura = assinatura_meses(agregado)
+            diario, marca = detalhamento['diario'], detalhamento['marca']
+            vencida = time.monotonic() - detalhamento['ultima_carga_completa'] >= detalhamento['recarga_completa']
+
+            meses = None
+            if diario is not None and not vencida:
+                if alterados is not None:
+                    meses, marca = alterados(marca)
+                else:
+                    meses = meses_desde_ultimo(diario, assinatura)
+                if meses is not None:
+                    meses = sorted(set(meses) | set(meses_alterados(detalhamento['assinatura'], assinatura)))
+
+            if meses is None:
+                # A marca é lida antes dos dados para não perder alterações feitas no meio da leitura
+                if alterados is not None:
+                    _, marca = alterados(None)
+                diario = carregar(None)
+                detalhamento['ultima_carga_completa'] = time.monotonic()
+            elif meses:
+                diario = substituir_meses(diario, carregar(meses), meses)
+            detalhamento.update(diario=diario, assinatura=assinatura, marca=marca, indice=construir_indice(diario),
+                                versao=versao)
+        return detalhamento['indice']
+    finally:
+        detalhamento['trava'].release()
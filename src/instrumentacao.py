@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import resource
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+
+# Instrumentação opcional (DASHBOARD_PROFILING=1) das etapas de cada execução do dashboard:
+# tempo de parede, linhas envolvidas, acerto/falha de cache e variação de memória residente.
+
+logger = logging.getLogger("dashboard.desempenho")
+
+# Quantidade de medições recentes guardadas por etapa para os percentis
+JANELA_METRICAS = 1000
+
+TAMANHO_PAGINA = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+# Memória residente atual do processo (bytes); fora do Linux usa o pico como aproximação
+def memoria_residente():
+    try:
+        with open("/proc/self/statm") as arquivo:
+            return int(arquivo.read().split()[1]) * TAMANHO_PAGINA
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# Envia as linhas de log de desempenho (JSON) para a saída padrão, uma única vez por processo
+def configurar_log():
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+# Registro das etapas de uma execução (rerun) do script
+def novo_registro(ativo):
+    return {'ativo': ativo, 'etapas': []}
+
+
+# Mede uma etapa. O dicionário devolvido pode receber 'linhas' e 'cache' ("acerto"/"falha") dentro do bloco.
+# Com o registro desativado o custo é só o de um dicionário vazio.
+@contextmanager
+def medir_etapa(registro, etapa):
+    medida = {'etapa': etapa}
+    if not registro['ativo']:
+        yield medida
+        return
+    memoria_inicial = memoria_residente()
+    inicio = time.perf_counter()
+    try:
+        yield medida
+    finally:
+        medida['segundos'] = time.perf_counter() - inicio
+        medida['memoria_delta_mb'] = (memoria_residente() - memoria_inicial) / (1024 * 1024)
+        registro['etapas'].append(medida)
+
+
+# Métricas acumuladas do processo, compartilhadas entre as sessões
+def criar_metricas(janela=JANELA_METRICAS):
+    return {'janela': janela, 'tempos': {}, 'contagens': {}, 'somas': {}, 'cache': {}, 'trava': threading.Lock()}
+
+
+# Incorpora as etapas de uma execução às métricas do processo e emite uma linha de log JSON por etapa
+def registrar(metricas, registro):
+    with metricas['trava']:
+        for medida in registro['etapas']:
+            etapa = medida['etapa']
+            metricas['tempos'].setdefault(etapa, deque(maxlen=metricas['janela'])).append(medida['segundos'])
+            metricas['contagens'][etapa] = metricas['contagens'].get(etapa, 0) + 1
+            metricas['somas'][etapa] = metricas['somas'].get(etapa, 0.0) + medida['segundos']
+            if 'cache' in medida:
+                chave = (etapa, medida['cache'])
+                metricas['cache'][chave] = metricas['cache'].get(chave, 0) + 1
+    for medida in registro['etapas']:
+        logger.info(json.dumps(medida, ensure_ascii=False, default=str))
+
+
+# p50 e p95 (em segundos) das medições recentes de cada etapa
+def percentis(metricas):
+    with metricas['trava']:
+        tempos = {etapa: list(valores) for etapa, valores in metricas['tempos'].items()}
+    return {etapa: (float(np.percentile(valores, 50)), float(np.percentile(valores, 95))) for etapa, valores in tempos.items()}
+
+
+# Métricas no formato texto do Prometheus (summary por etapa e contador de cache)
+def texto_prometheus(metricas):
+    linhas = [
+        "# HELP dashboard_etapa_segundos Tempo de parede por etapa do dashboard.",
+        "# TYPE dashboard_etapa_segundos summary",
+    ]
+    with metricas['trava']:
+        contagens = dict(metricas['contagens'])
+        somas = dict(metricas['somas'])
+        cache = dict(metricas['cache'])
+    for etapa, (p50, p95) in percentis(metricas).items():
+        linhas.append(f'dashboard_etapa_segundos{{etapa="{etapa}",quantile="0.5"}} {p50:.6f}')
+        linhas.append(f'dashboard_etapa_segundos{{etapa="{etapa}",quantile="0.95"}} {p95:.6f}')
+        linhas.append(f'dashboard_etapa_segundos_sum{{etapa="{etapa}"}} {somas[etapa]:.6f}')
+        linhas.append(f'dashboard_etapa_segundos_count{{etapa="{etapa}"}} {contagens[etapa]}')
+    linhas += [
+        "# HELP dashboard_cache_total Acertos e falhas de cache por etapa.",
+        "# TYPE dashboard_cache_total counter",
+    ]
+    for (etapa, resultado), total in cache.items():
+        linhas.append(f'dashboard_cache_total{{etapa="{etapa}",resultado="{resultado}"}} {total}')
+    return "\n".join(linhas) + "\n"
+
+
+# Grava o texto do Prometheus de forma atômica, para o textfile collector do node_exporter
+def exportar_prometheus(metricas, caminho):
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, "w") as arquivo:
+        arquivo.write(texto_prometheus(metricas))
+    os.replace(temporario, caminho)
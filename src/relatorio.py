@@ -0,0 +1,107 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from babel.numbers import format_currency
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+from variacao import formatar_variacao
+
+# Quantidade padrão de relatórios guardados e de threads gerando PDFs
+LIMITE_RELATORIOS_PADRAO = 32
+THREADS_PADRAO = 2
+
+LARGURA, ALTURA = A4
+MARGEM = 50
+
+
+# Função para formatar valores monetários brasileiros
+def format_currency_br(value):
+    return format_currency(value, 'BRL', locale='pt_BR')
+
+
+# Desenha a imagem PNG já renderizada ocupando a largura útil da página, a partir de `topo`
+def desenhar_imagem(c, imagem, topo):
+    leitor = ImageReader(BytesIO(imagem))
+    largura_img, altura_img = leitor.getSize()
+    largura = LARGURA - 2 * MARGEM
+    altura = largura * altura_img / largura_img
+    c.drawImage(leitor, MARGEM, topo - altura, width=largura, height=altura)
+    return topo - altura
+
+
+# Tabela de variação (grupo, anterior, atual, variação), quebrando página quando necessário
+def desenhar_tabela(c, titulo, dados, coluna, topo):
+    y = topo
+    c.setFont("Helvetica-Bold", 11)
+    c.drawString(MARGEM, y, titulo)
+    c.setFont("Helvetica", 9)
+    y -= 18
+    for _, linha in dados.iterrows():
+        if y < MARGEM:
+            c.showPage()
+            c.setFont("Helvetica", 9)
+            y = ALTURA - MARGEM
+        c.drawString(MARGEM, y, str(linha[coluna])[:45])
+        c.drawRightString(360, y, format_currency_br(linha['ANTERIOR']))
+        c.drawRightString(460, y, format_currency_br(linha['ATUAL']))
+        c.drawRightString(LARGURA - MARGEM, y, formatar_variacao(linha['VARIACAO_PERCENTUAL']))
+        y -= 14
+    return y
+
+
+# Monta o PDF com o resumo do período, os gráficos já renderizados e as tabelas de variação
+def gerar_pdf(resumo, imagem_categoria, imagem_produto, dados_porcentagem_categoria, dados_porcentagem_produto):
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+
+    # Adicionar textos e gráficos no PDF
+    c.drawString(100, 800, f"Recebimento mês atual ({resumo['mes_atual']}/{resumo['ano_atual']}): {resumo['valor_atual']}")
+    c.drawString(100, 780, f"Recebimento mês anterior ({resumo['mes_anterior']}/{resumo['ano_anterior']}): {resumo['valor_anterior']}")
+    c.drawString(100, 760, f"Variação percentual: {formatar_variacao(resumo['variacao'])}")
+    c.drawString(100, 740, f"Categoria: {resumo['categoria']}")
+
+    y = desenhar_imagem(c, imagem_categoria, 720)
+    desenhar_tabela(c, "Variação Percentual por Categoria", dados_porcentagem_categoria, 'CATEGORIA', y - 20)
+
+    c.showPage()
+    y = desenhar_imagem(c, imagem_produto, ALTURA - MARGEM)
+    desenhar_tabela(c, "Variação Percentual por Produto", dados_porcentagem_produto, 'ITEM_PCG', y - 20)
+
+    # Salvar PDF no buffer
+    c.save()
+    return buffer.getvalue()
+
+
+# Fila de geração de PDFs em segundo plano, com os resultados guardados por chave (LRU)
+def criar_fila_relatorios(threads=THREADS_PADRAO, limite=LIMITE_RELATORIOS_PADRAO):
+    return {
+        'executor': ThreadPoolExecutor(max_workers=threads, thread_name_prefix="relatorio"),
+        'futuros': OrderedDict(),
+        'limite': limite,
+        'trava': threading.Lock(),
+    }
+
+
+# Relatório já solicitado para a chave (pronto ou em andamento), ou None
+def consultar_relatorio(fila, chave):
+    with fila['trava']:
+        futuro = fila['futuros'].get(chave)
+        if futuro is not None:
+            fila['futuros'].move_to_end(chave)
+        return futuro
+
+
+# Agenda a geração do PDF para a chave, reaproveitando um pedido anterior idêntico
+def solicitar_relatorio(fila, chave, *args):
+    with fila['trava']:
+        futuro = fila['futuros'].get(chave)
+        # Pedidos que falharam são refeitos
+        if futuro is None or (futuro.done() and futuro.exception() is not None):
+            futuro = fila['executor'].submit(gerar_pdf, *args)
+            fila['futuros'][chave] = futuro
+        fila['futuros'].move_to_end(chave)
+        while len(fila['futuros']) > fila['limite']:
+            fila['futuros'].popitem(last=False)
+        return futuro
@@ -0,0 +1,153 @@
+import argparse
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from dotenv import load_dotenv
+from conexao import criar_engine
+from consultas import TABELA_RECEBIMENTOS, ano_mes, carregar_agregado
+from cubo import construir_cubo, densificar, extremos
+from graficos import renderizar_grafico_categoria, renderizar_grafico_produto
+from relatorio import format_currency_br, gerar_pdf
+from snapshot import carregar_snapshot
+from variacao import variacao_percentual
+
+# Gera o relatório de variação mensal (o mesmo PDF do dashboard) para todas as categorias
+# e todos os meses de um ano, sem passar pela interface do Streamlit.
+#
+# Exemplo:
+#   python relatorios_lote.py --ano 2024 --saida relatorios --zip
+
+
+# Nome de arquivo seguro para a categoria
+def nome_arquivo(categoria):
+    return re.sub(r"[^\w-]+", "_", categoria).strip("_") or "categoria"
+
+
+# Tabela no formato de `cubo.variacao`, só com os grupos que tiveram recebimento em algum dos meses
+def montar_tabela(coluna, rotulos, atual, anterior, variacao):
+    dados = pd.DataFrame({coluna: rotulos, 'ATUAL': atual, 'ANTERIOR': anterior, 'VARIACAO_PERCENTUAL': variacao})
+    return dados[(dados['ATUAL'] != 0) | (dados['ANTERIOR'] != 0)].reset_index(drop=True)
+
+
+# Calcula de uma só vez, por deslocamento de um mês na linha do tempo do cubo, as tabelas de
+# todos os pares (mês, mês anterior) do ano e monta uma tarefa por categoria × mês (mais "Todos").
+def montar_tarefas(cubo, ano, saida, categorias=None):
+    linha_do_tempo, valores = densificar(cubo)             # (mês, categoria, produto)
+    por_categoria = valores.sum(axis=2)                    # (mês, categoria)
+    por_produto = valores.sum(axis=1)                      # (mês, produto)
+
+    # Posição t comparada com t - 1
+    var_categoria = variacao_percentual(por_categoria[1:], por_categoria[:-1])
+    var_produto = variacao_percentual(por_produto[1:], por_produto[:-1])
+    var_produto_categoria = variacao_percentual(valores[1:], valores[:-1])
+    var_total = variacao_percentual(por_categoria[1:].sum(axis=1), por_categoria[:-1].sum(axis=1))
+
+    nomes_categorias = list(cubo['categorias'])
+    selecionadas = ["Todos"] + [c for c in nomes_categorias if categorias is None or c in categorias]
+    tarefas = []
+
+    for t in range(1, len(linha_do_tempo)):
+        ano_atual, mes_atual = ano_mes(linha_do_tempo[t])
+        if ano_atual != ano:
+            continue
+        ano_anterior, mes_anterior = ano_mes(linha_do_tempo[t - 1])
+        total_atual, total_anterior = por_categoria[t].sum(), por_categoria[t - 1].sum()
+
+        tabela_categorias = montar_tabela('CATEGORIA', nomes_categorias, por_categoria[t], por_categoria[t - 1], var_categoria[t - 1])
+        for categoria in selecionadas:
+            if categoria == "Todos":
+                dados_categoria = tabela_categorias
+                dados_produto = montar_tabela('ITEM_PCG', cubo['produtos'], por_produto[t], por_produto[t - 1], var_produto[t - 1])
+            else:
+                c = nomes_categorias.index(categoria)
+                dados_categoria = tabela_categorias[tabela_categorias['CATEGORIA'] == categoria].reset_index(drop=True)
+                dados_produto = montar_tabela('ITEM_PCG', cubo['produtos'], valores[t, c], valores[t - 1, c], var_produto_categoria[t - 1, c])
+
+            resumo = {
+                'mes_atual': mes_atual, 'ano_atual': ano_atual, 'valor_atual': format_currency_br(total_atual),
+                'mes_anterior': mes_anterior, 'ano_anterior': ano_anterior, 'valor_anterior': format_currency_br(total_anterior),
+                'variacao': var_total[t - 1], 'categoria': categoria,
+            }
+            caminho = os.path.join(saida, f"{ano_atual}-{mes_atual:02d}", f"{nome_arquivo(categoria)}.pdf")
+            tarefas.append((caminho, resumo, dados_categoria, dados_produto))
+    return tarefas
+
+
+# Executada nos processos filhos: renderiza os gráficos, monta o PDF e grava o arquivo
+def gerar_relatorio(tarefa):
+    caminho, resumo, dados_categoria, dados_produto = tarefa
+    inicio = time.perf_counter()
+    imagem_categoria = renderizar_grafico_categoria(dados_categoria)
+    imagem_produto = renderizar_grafico_produto(extremos(dados_produto, 'ITEM_PCG'))
+    renderizado = time.perf_counter()
+    pdf = gerar_pdf(resumo, imagem_categoria, imagem_produto, dados_categoria, dados_produto)
+    gerado = time.perf_counter()
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    with open(caminho, "wb") as arquivo:
+        arquivo.write(pdf)
+    return {'graficos': renderizado - inicio, 'pdf': gerado - renderizado, 'escrita': time.perf_counter() - gerado}
+
+
+# API principal: gera os relatórios do ano a partir do agregado já carregado e devolve os tempos por etapa
+def gerar_lote(agregado, ano, saida, categorias=None, processos=None, compactar=False):
+    tempos = {}
+
+    inicio = time.perf_counter()
+    cubo = construir_cubo(agregado)
+    tarefas = montar_tarefas(cubo, ano, saida, categorias)
+    tempos['calculo'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        resultados = list(executor.map(gerar_relatorio, tarefas, chunksize=4))
+    tempos['relatorios'] = time.perf_counter() - inicio
+    # Tempo somado gasto pelos processos em cada etapa
+    for etapa in ('graficos', 'pdf', 'escrita'):
+        tempos[f'{etapa} (soma)'] = sum(resultado[etapa] for resultado in resultados)
+
+    if compactar:
+        inicio = time.perf_counter()
+        shutil.make_archive(saida, "zip", saida)
+        tempos['zip'] = time.perf_counter() - inicio
+
+    tempos['relatorios gerados'] = len(tarefas)
+    return tempos
+
+
+# Carrega o agregado uma única vez, do snapshot local ou do banco
+def carregar_dados(diretorio_snapshot=None, tabela=TABELA_RECEBIMENTOS):
+    if diretorio_snapshot:
+        snapshot = carregar_snapshot(diretorio_snapshot)
+        if snapshot is not None:
+            return snapshot[0]
+    engine = criar_engine()
+    with engine.connect() as connection:
+        return carregar_agregado(connection, tabela)
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Gera o relatório de variação mensal para todas as categorias e meses de um ano.")
+    parser.add_argument("--ano", type=int, required=True, help="Ano dos meses de referência")
+    parser.add_argument("--saida", default="relatorios", help="Diretório de saída dos PDFs")
+    parser.add_argument("--categorias", nargs="*", help="Categorias a gerar (padrão: todas)")
+    parser.add_argument("--processos", type=int, help="Número de processos (padrão: número de CPUs)")
+    parser.add_argument("--zip", action="store_true", help="Compacta o diretório de saída em um .zip")
+    parser.add_argument("--snapshot", default=os.getenv("SNAPSHOT_DIR"), help="Diretório do snapshot local, em vez do banco")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    agregado = carregar_dados(args.snapshot, os.getenv("DB_TABELA", TABELA_RECEBIMENTOS))
+    carga = time.perf_counter() - inicio
+
+    tempos = {'carga': carga, **gerar_lote(agregado, args.ano, args.saida, args.categorias, args.processos, args.zip)}
+    tempos['total'] = time.perf_counter() - inicio
+    for etapa, valor in tempos.items():
+        print(f"{etapa:>20}: {valor}" if isinstance(valor, int) else f"{etapa:>20}: {valor:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import threading
+import time
+from datetime import date
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from consultas import TABELA_RECEBIMENTOS, TRUNCAR_MES, ano_mes, carregar_agregado, ordinal_mes, para_categoria
+from snapshot import carregar_snapshot, salvar_snapshot
+
+# Intervalo padrão entre sincronizações incrementais (segundos)
+INTERVALO_PADRAO = 900
+
+
+# Cria o estado da sincronização e faz a carga inicial.
+# `coluna_atualizacao` (ex.: "updated_at") permite detectar linhas alteradas em meses antigos;
+# sem ela a marca d'água é o último mês de "DATA", que é sempre relido por inteiro.
+# Com `diretorio_snapshot`, a carga inicial vem do snapshot Parquet local (se existir) e o banco
+# é consultado em segundo plano só pelo incremento; o snapshot é regravado a cada nova versão.
+# `opcoes_carga` é repassado a `carregar_agregado` (ex.: no_banco, tamanho_lote).
+def criar_sincronizacao(engine, tabela=TABELA_RECEBIMENTOS, intervalo=INTERVALO_PADRAO, coluna_atualizacao=None,
+                        diretorio_snapshot=None, opcoes_carga=None):
+    estado = {
+        'engine': engine,
+        'tabela': tabela,
+        'intervalo': intervalo,
+        'coluna_atualizacao': coluna_atualizacao,
+        'trava': threading.Lock(),
+        'dados': (None, 0),  # (agregado, versão) trocados juntos numa única atribuição
+        'marca_atualizacao': None,
+        'ultima_sincronizacao': 0.0,
+        'diretorio_snapshot': diretorio_snapshot,
+        'opcoes_carga': opcoes_carga or {},
+    }
+
+    snapshot = carregar_snapshot(diretorio_snapshot) if diretorio_snapshot else None
+    if snapshot is not None:
+        agregado, estado['marca_atualizacao'] = snapshot
+        publicar(estado, agregado)
+        threading.Thread(target=atualizar_em_segundo_plano, args=(estado,), daemon=True).start()
+    else:
+        with estado['trava']:
+            carregar_completo(estado)
+    return estado
+
+
+# Maior valor da coluna de atualização já visto pelo banco
+def ler_marca_atualizacao(connection, tabela, coluna):
+    return connection.execute(text(f"SELECT MAX(\"{coluna}\") FROM {tabela}")).scalar()
+
+
+# Meses (ano, mês) com linhas alteradas depois da marca de atualização
+def meses_alterados(connection, tabela, coluna, marca):
+    truncar = TRUNCAR_MES.get(connection.dialect.name, TRUNCAR_MES['postgresql'])
+    query = text(f"SELECT DISTINCT {truncar} FROM {tabela} WHERE \"{coluna}\" > :marca")
+    periodos = pd.to_datetime(list(connection.execute(query, {'marca': marca}).scalars()))
+    return [(periodo.year, periodo.month) for periodo in periodos]
+
+
+# Substitui no agregado os meses em `periodos` (ordinais) pelas linhas recém-lidas,
+# reconstruindo as categorias para que a união continue compacta
+def mesclar_agregado(agregado, novo, periodos):
+    mantidos = agregado[~agregado['PERIODO'].isin(periodos)]
+    mesclado = pd.concat([mantidos, novo], ignore_index=True)
+    for coluna in ('CATEGORIA', 'ITEM_PCG'):
+        mesclado[coluna] = para_categoria(mesclado[coluna])
+    return mesclado
+
+
+# Compara dois recortes do agregado ignorando a ordem das linhas e das categorias
+def mesmo_conteudo(a, b):
+    colunas = list(a.columns)
+    a = a.astype({'CATEGORIA': str, 'ITEM_PCG': str}).sort_values(colunas).reset_index(drop=True)
+    b = b.astype({'CATEGORIA': str, 'ITEM_PCG': str}).sort_values(colunas).reset_index(drop=True)
+    return a.equals(b)
+
+
+# Publica um novo agregado incrementando a versão dos dados
+def publicar(estado, agregado):
+    _, versao = estado['dados']
+    estado['dados'] = (agregado, versao + 1)
+
+
+# Regrava o snapshot local; uma falha de disco não deve derrubar o dashboard
+def persistir(estado):
+    if not estado['diretorio_snapshot']:
+        return
+    agregado, _ = estado['dados']
+    try:
+        salvar_snapshot(agregado, estado['diretorio_snapshot'], estado['marca_atualizacao'])
+    except OSError as erro:
+        print(f"Não foi possível gravar o snapshot local: {erro}")
+
+
+def carregar_completo(estado):
+    tabela, coluna = estado['tabela'], estado['coluna_atualizacao']
+    with estado['engine'].connect() as connection:
+        agregado = carregar_agregado(connection, tabela, **estado['opcoes_carga'])
+        marca = ler_marca_atualizacao(connection, tabela, coluna) if coluna else None
+    publicar(estado, agregado)
+    estado['marca_atualizacao'] = marca
+    estado['ultima_sincronizacao'] = time.monotonic()
+    persistir(estado)
+
+
+# Busca só os meses novos ou alterados e os mescla no agregado em memória
+def atualizar_incremental(estado):
+    agregado, _ = estado['dados']
+    tabela, coluna = estado['tabela'], estado['coluna_atualizacao']
+
+    # Sem marca de atualização (carga inicial vazia ou snapshot gravado antes de a coluna ser configurada)
+    # não há como saber o que mudou: recarrega tudo, em vez de comparar com NULL e não achar nada
+    if agregado is None or agregado.empty or (coluna and estado['marca_atualizacao'] is None):
+        carregar_completo(estado)
+        return
+
+    with estado['engine'].connect() as connection:
+        if coluna:
+            # A nova marca é lida antes dos meses para não perder alterações feitas no meio da leitura
+            marca = ler_marca_atualizacao(connection, tabela, coluna)
+            if marca is None or marca == estado['marca_atualizacao']:
+                novo = None
+            else:
+                meses = meses_alterados(connection, tabela, coluna, estado['marca_atualizacao'])
+                periodos = [ordinal_mes(ano, mes) for ano, mes in meses]
+                novo = carregar_agregado(connection, tabela, meses=meses, **estado['opcoes_carga']) if meses else None
+        else:
+            # Marca d'água em "DATA": relê o último mês carregado (que pode estar incompleto) e os seguintes
+            desde = int(agregado['PERIODO'].max())
+            anterior = agregado[agregado['PERIODO'] >= desde]
+            periodos = anterior['PERIODO'].unique()
+            novo = carregar_agregado(connection, tabela, desde=date(*ano_mes(desde), 1), **estado['opcoes_carga'])
+            if mesmo_conteudo(novo, anterior):
+                novo = None
+            marca = None
+
+    estado['marca_atualizacao'] = marca
+    estado['ultima_sincronizacao'] = time.monotonic()
+    if novo is not None:
+        publicar(estado, mesclar_agregado(agregado, novo, periodos))
+        persistir(estado)
+
+
+# Atualiza a partir do banco logo após subir com o snapshot; se o banco estiver fora, segue offline
+def atualizar_em_segundo_plano(estado):
+    with estado['trava']:
+        try:
+            atualizar_incremental(estado)
+        except SQLAlchemyError as erro:
+            print(f"Banco indisponível, usando o snapshot local: {erro}")
+            estado['ultima_sincronizacao'] = time.monotonic()
+
+
+# Sincronização incremental disparada por `sincronizar`; a trava já vem adquirida e é liberada ao final
+def sincronizar_em_segundo_plano(estado):
+    try:
+        # Outra sessão pode ter concluído a sincronização enquanto esta verificava o prazo
+        if time.monotonic() - estado['ultima_sincronizacao'] >= estado['intervalo']:
+            atualizar_incremental(estado)
+    except SQLAlchemyError as erro:
+        print(f"Falha na sincronização incremental, mantendo os dados atuais: {erro}")
+        estado['ultima_sincronizacao'] = time.monotonic()
+    finally:
+        estado['trava'].release()
+
+
+# Devolve (agregado, versão) atuais. Se o intervalo venceu, a sincronização corre em segundo plano
+# (uma por processo de cada vez) e a nova versão aparece num próximo acesso; nenhuma sessão espera pelo banco.
+def sincronizar(estado):
+    intervalo = estado['intervalo']
+    vencida = intervalo and time.monotonic() - estado['ultima_sincronizacao'] >= intervalo
+
+    if vencida and estado['trava'].acquire(blocking=False):
+        threading.Thread(target=sincronizar_em_segundo_plano, args=(estado,), daemon=True).start()
+
+    return estado['dados']
@@ -0,0 +1,109 @@
+import fcntl
+import json
+import os
+import shutil
+import time
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Diretório padrão do snapshot local (fora do controle de versão, ver .gitignore)
+DIRETORIO_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache", "recebimentos")
+
+# Arquivo que aponta para o snapshot vigente; é trocado de forma atômica a cada gravação
+ARQUIVO_ATUAL = "ATUAL.json"
+
+# Lock que serializa gravação, troca do ponteiro e limpeza entre os processos que compartilham o diretório
+ARQUIVO_LOCK = "gravacao.lock"
+
+
+# Grava o agregado como Parquet particionado por ano/mês em um novo subdiretório
+# e só então troca o ponteiro, para que leitores nunca vejam um snapshot pela metade.
+# Vários workers podem gravar no mesmo diretório: o lock de arquivo impede que a limpeza de um
+# apague o subdiretório que outro ainda está gravando.
+def salvar_snapshot(agregado, diretorio=DIRETORIO_PADRAO, marca_atualizacao=None):
+    os.makedirs(diretorio, exist_ok=True)
+    with open(os.path.join(diretorio, ARQUIVO_LOCK), "a+") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        gravar_snapshot(agregado, diretorio, marca_atualizacao)
+
+
+def gravar_snapshot(agregado, diretorio, marca_atualizacao):
+    nome = f"snapshot-{time.time_ns()}-{os.getpid()}"
+
+    tabela = pa.Table.from_pandas(agregado, preserve_index=False)
+    ano, mes = divmod(agregado['PERIODO'].to_numpy(), 12)
+    tabela = tabela.append_column('ANO', pa.array(ano, pa.int16()))
+    tabela = tabela.append_column('MES', pa.array(mes + 1, pa.int8()))
+    ds.write_dataset(tabela, os.path.join(diretorio, nome), format="parquet",
+                     partitioning=['ANO', 'MES'], partitioning_flavor="hive")
+
+    ponteiro = {'caminho': nome, 'marca_atualizacao': serializar_marca(marca_atualizacao)}
+    temporario = os.path.join(diretorio, f".{nome}.json")
+    with open(temporario, "w") as arquivo:
+        json.dump(ponteiro, arquivo)
+    anterior = ler_ponteiro(diretorio)
+    os.replace(temporario, os.path.join(diretorio, ARQUIVO_ATUAL))
+
+    remover_snapshots_antigos(diretorio, {nome, anterior})
+
+
+# Marca de atualização em JSON com o seu tipo ({'tipo', 'valor'}), para que volte do snapshot com o mesmo tipo
+# que o banco devolve e as comparações com a marca lida do banco continuem valendo depois de reiniciar
+def serializar_marca(marca):
+    if marca is None:
+        return None
+    if isinstance(marca, datetime):
+        return {'tipo': 'datetime', 'valor': marca.isoformat()}
+    if isinstance(marca, date):
+        return {'tipo': 'date', 'valor': marca.isoformat()}
+    if isinstance(marca, Decimal):
+        return {'tipo': 'decimal', 'valor': str(marca)}
+    if isinstance(marca, (int, float)):
+        return {'tipo': type(marca).__name__, 'valor': marca}
+    return {'tipo': 'str', 'valor': str(marca)}
+
+
+LEITORES_MARCA = {'datetime': datetime.fromisoformat, 'date': date.fromisoformat, 'decimal': Decimal,
+                  'int': int, 'float': float, 'str': str}
+
+
+# Marca gravada por `serializar_marca`. Ponteiros antigos (marca como texto, sem o tipo) devolvem None,
+# o que faz a próxima sincronização reler tudo e gravar a marca no formato novo.
+def ler_marca(valor):
+    if not isinstance(valor, dict):
+        return None
+    return LEITORES_MARCA[valor['tipo']](valor['valor'])
+
+
+# Subdiretório apontado pelo ponteiro atual, ou None
+def ler_ponteiro(diretorio):
+    try:
+        with open(os.path.join(diretorio, ARQUIVO_ATUAL)) as arquivo:
+            return json.load(arquivo)['caminho']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+# Apaga snapshots substituídos, preservando o vigente e o anterior (que um leitor pode estar abrindo agora)
+def remover_snapshots_antigos(diretorio, preservados):
+    for nome in os.listdir(diretorio):
+        if nome.startswith("snapshot-") and nome not in preservados:
+            shutil.rmtree(os.path.join(diretorio, nome), ignore_errors=True)
+
+
+# Carrega o snapshot vigente com memory mapping. Devolve (agregado, marca_atualizacao) ou None se não houver.
+def carregar_snapshot(diretorio=DIRETORIO_PADRAO):
+    try:
+        with open(os.path.join(diretorio, ARQUIVO_ATUAL)) as arquivo:
+            ponteiro = json.load(arquivo)
+        tabela = pq.read_table(os.path.join(diretorio, ponteiro['caminho']), memory_map=True, partitioning="hive")
+        marca_atualizacao = ler_marca(ponteiro.get('marca_atualizacao'))
+    except (OSError, ValueError, KeyError, InvalidOperation) as erro:
+        print(f"Snapshot local indisponível: {erro}")
+        return None
+
+    agregado = tabela.drop_columns(['ANO', 'MES']).to_pandas()
+    return agregado, marca_atualizacao
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+# Comparações disponíveis e o deslocamento (em meses) de cada uma
+DESLOCAMENTOS = {'MOM': 1, 'YOY': 12}
+
+# Janela padrão (em meses) da variação acumulada móvel
+JANELA_PADRAO = 3
+
+
+# Variação percentual vetorizada. Denominador zerado ou ausente não gera inf: a variação fica NaN
+# e deve ser lida junto com `tem_base`.
+def variacao_percentual(atual, anterior):
+    atual = np.asarray(atual, dtype=float)
+    anterior = np.asarray(anterior, dtype=float)
+    base = tem_base(anterior)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(base, (atual - anterior) / np.where(base, anterior, 1) * 100, np.nan)
+
+
+# Há base de comparação quando o valor anterior existe e é diferente de zero
+def tem_base(anterior):
+    anterior = np.asarray(anterior, dtype=float)
+    return ~np.isnan(anterior) & (anterior != 0)
+
+
+# Texto da variação para rótulos de gráficos e relatórios
+def formatar_variacao(var):
+    return "s/ base" if pd.isna(var) else f"{var:.2f}%"
+
+
+# Pivota o agregado normalizado em um painel (mês × grupo) contínuo, em reais.
+# Meses sem recebimento entram com zero para que os deslocamentos contem meses corridos.
+def pivotar(agregado, dimensao=None):
+    if dimensao is None:
+        painel = agregado.groupby('PERIODO')['TOTAL_RECEBIDO'].sum().to_frame('TOTAL')
+    else:
+        painel = agregado.pivot_table(index='PERIODO', columns=dimensao, values='TOTAL_RECEBIDO',
+                                      aggfunc='sum', fill_value=0, observed=True)
+    if painel.empty:
+        return painel.astype(float)
+    meses = pd.RangeIndex(painel.index.min(), painel.index.max() + 1, name='PERIODO')
+    return painel.reindex(meses, fill_value=0) / 100
+
+
+# Calcula, numa única passada sobre o painel, o valor do mês e as variações mês a mês (MOM),
+# ano a ano (YOY) e da soma móvel de `janela` meses contra a janela imediatamente anterior.
+# Devolve uma linha por (PERIODO, grupo), com VAR_* = NaN e BASE_* = False quando não há base.
+def calcular_variacoes(painel, janela=JANELA_PADRAO):
+    nome_grupo = painel.columns.name or 'GRUPO'
+    colunas = {'VALOR': painel}
+
+    for nome, passos in DESLOCAMENTOS.items():
+        anterior = painel.shift(passos)
+        colunas[f'ANTERIOR_{nome}'] = anterior
+        colunas[f'VAR_{nome}'] = pd.DataFrame(variacao_percentual(painel, anterior), index=painel.index, columns=painel.columns)
+        colunas[f'BASE_{nome}'] = pd.DataFrame(tem_base(anterior), index=painel.index, columns=painel.columns)
+
+    acumulado = painel.rolling(janela, min_periods=janela).sum()
+    acumulado_anterior = acumulado.shift(janela)
+    colunas['JANELA'] = acumulado
+    colunas['VAR_JANELA'] = pd.DataFrame(variacao_percentual(acumulado, acumulado_anterior), index=painel.index, columns=painel.columns)
+    colunas['BASE_JANELA'] = pd.DataFrame(tem_base(acumulado_anterior), index=painel.index, columns=painel.columns)
+
+    longo = pd.concat({nome: quadro.stack(future_stack=True) for nome, quadro in colunas.items()}, axis=1)
+    longo.index = longo.index.set_names(['PERIODO', nome_grupo])
+    return longo.reset_index()